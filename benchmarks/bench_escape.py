@@ -0,0 +1,109 @@
+"""Micro-benchmark for helper.cpp_str_esc.
+
+Usage: python benchmarks/bench_escape.py [--max-size bytes] [--reference]
+
+Escapes synthetic JS/CSS like input from 1 KB up to 10 MB and prints the
+throughput. Output is compared against the original (character by
+character) implementation for every size the reference is run on."""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from webduino_generator.helper import cpp_str_esc  # noqa: E402
+
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20]
+
+# The reference implementation is slow. Do not run it on huge inputs.
+REFERENCE_MAX_SIZE = 1 << 20
+
+
+def cpp_str_esc_reference(s):
+    # Implementation cpp_str_esc used to have. Kept for comparison.
+    result = ''
+    for c in s:
+        if not (32 <= ord(c) < 127) or c in ('\\', '"'):
+            result += '\\%03o' % ord(c)
+        else:
+            result += c
+    return result
+
+
+def make_text(size, non_ascii=False, seed=0):
+    rng = random.Random(seed)
+    words = ["function", "var", "return", "{", "}", "(", ")", ";", "\n",
+             "    ", "\"string\"", "'x'", "\\n", "\t", "color: #fff;",
+             "<div class=\"a\">", "</div>", "0x1f", "==", "+="]
+    if non_ascii:
+        words += ["ä", "ß", "€", "☺"]
+
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        parts.append(word)
+        length += len(word)
+    return "".join(parts)[:size]
+
+
+def measure(function, data, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cpp_str_esc micro-benchmark")
+    parser.add_argument("--max-size", type=int, default=SIZES[-1],
+                        help="Largest input size in bytes (default: 10 MB)")
+    parser.add_argument("--reference", action="store_true",
+                        help="Also time the original implementation")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per measurement, best one is reported")
+    args = parser.parse_args()
+
+    print("%-10s %-9s %12s %12s %12s" %
+          ("Size", "Input", "Time (ms)", "MB/s", "Reference"))
+
+    failed = False
+    for size in [size for size in SIZES if size <= args.max_size]:
+        inputs = [("ascii", make_text(size)),
+                  ("unicode", make_text(size, non_ascii=True)),
+                  ("bytes", make_text(size, non_ascii=True).encode("UTF-8"))]
+
+        for name, data in inputs:
+            elapsed, result = measure(cpp_str_esc, data, args.repeat)
+
+            reference = "-"
+            if name != "bytes" and size <= REFERENCE_MAX_SIZE:
+                ref_elapsed, ref_result = measure(cpp_str_esc_reference, data,
+                                                  1 if args.reference else 0) \
+                    if args.reference else (None, cpp_str_esc_reference(data))
+                if ref_result != result:
+                    reference = "MISMATCH"
+                    failed = True
+                elif ref_elapsed is not None:
+                    reference = "%.1f ms" % (ref_elapsed * 1000)
+                else:
+                    reference = "identical"
+
+            print("%-10s %-9s %12.2f %12.1f %12s" %
+                  (size, name, elapsed * 1000,
+                   len(data) / elapsed / (1 << 20), reference))
+
+    if failed:
+        print("Output differs from reference implementation!")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Benchmark of the generator on synthetic projects.
+
+Usage: python benchmarks/bench_generator.py [--corpus name] [--scale factor]
+                                            [--save file] [--compare file]
+
+Creates synthetic input folders (many small files, large assets, binary
+files, deep folder trees, dynamic .cpp pages) and times get_files_rec,
+get_input_data, generate_from_template and generate on each of them.
+Prints throughput (MB/s and files/s of the input) and peak memory
+(tracemalloc, measured in a separate run).
+
+Results can be saved as JSON baseline and compared against later runs,
+e.g. before and after a change:
+
+    python benchmarks/bench_generator.py --save before.json
+    python benchmarks/bench_generator.py --compare before.json
+
+Comparing exits with 1 if a benchmark got slower than the threshold."""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from webduino_generator import __version__  # noqa: E402
+from webduino_generator.userio import UserIO  # noqa: E402
+from webduino_generator.helper import get_files_rec  # noqa: E402
+from webduino_generator.manifest import Manifest  # noqa: E402
+from webduino_generator.generator import get_template_path, get_input_data, \
+    get_build_id, generate_from_template, generate  # noqa: E402
+
+
+BASELINE_VERSION = 1
+
+# Synthetic projects. Sizes are medians of a log-normal distribution,
+# so every corpus has a few files much larger than the median.
+#   files:   number of input files
+#   size:    median file size in bytes
+#   binary:  share of binary files
+#   dynamic: share of .cpp pages
+#   depth:   maximum folder depth
+CORPORA = {
+    "site": {"files": 40, "size": 4 << 10, "binary": 0.1, "dynamic": 0.05, "depth": 2},
+    "many-small": {"files": 2000, "size": 512, "binary": 0.0, "dynamic": 0.0, "depth": 3},
+    "large-assets": {"files": 8, "size": 1 << 20, "binary": 0.5, "dynamic": 0.0, "depth": 1},
+    "binary": {"files": 100, "size": 16 << 10, "binary": 1.0, "dynamic": 0.0, "depth": 1},
+    "deep-tree": {"files": 300, "size": 2 << 10, "binary": 0.1, "dynamic": 0.0, "depth": 12},
+    "dynamic": {"files": 200, "size": 2 << 10, "binary": 0.0, "dynamic": 1.0, "depth": 2},
+}
+
+BENCHMARKS = ["get_files_rec", "get_input_data", "get_input_data (cached)",
+              "generate_from_template", "generate", "generate (unchanged)"]
+
+TEXT_TYPES = [".html", ".css", ".js", ".json", ".txt"]
+BINARY_TYPES = [".png", ".jpg", ".ico", ".bin"]
+
+WORDS = ["function", "var", "return", "{", "}", "(", ")", ";", "\n", "    ",
+         "\"string\"", "'x'", "\\n", "\t", "color: #fff;", "<div class=\"a\">",
+         "</div>", "0x1f", "==", "+=", "ä", "€"]
+
+DYNAMIC_PAGE = """void respond(WebServer &server, WebServer::ConnectionType type,
+             char *url_tail, bool tail_complete)
+{
+  server.httpSuccess("text/plain");
+%s}
+"""
+
+
+def make_text(rng, size):
+    parts = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        parts.append(word)
+        length += len(word)
+    return "".join(parts)[:size]
+
+
+def make_binary(rng, size):
+    # Starts with a byte that is never valid UTF-8
+    size = max(size - 1, 0)
+    return b"\xff" + rng.getrandbits(8 * size).to_bytes(size, "little")
+
+
+def make_dynamic(rng, size):
+    lines = []
+    length = 0
+    while length < size:
+        line = "  server.print(\"%s\");\n" % rng.choice(["on", "off", "value", "0"])
+        lines.append(line)
+        length += len(line)
+    return DYNAMIC_PAGE % "".join(lines)
+
+
+def make_corpus(path, files, size, binary, dynamic, depth, seed=0):
+    '''Writes synthetic input files to path. Returns number of bytes.'''
+
+    rng = random.Random(seed)
+    folders = [""]
+    total = 0
+    for i in range(files):
+        # Either stay in a known folder or go one level deeper
+        folder = rng.choice(folders)
+        if folder.count(os.sep) + 1 < depth and rng.random() < 0.3:
+            folder = os.path.join(folder, "dir%d" % len(folders))
+            folders.append(folder)
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+
+        file_size = max(1, int(rng.lognormvariate(0, 0.8) * size))
+        kind = rng.random()
+        if kind < dynamic:
+            name, data = "page%d.cpp" % i, make_dynamic(rng, file_size).encode("UTF-8")
+        elif kind < dynamic + binary:
+            name, data = "file%d%s" % (i, rng.choice(BINARY_TYPES)), make_binary(rng, file_size)
+        else:
+            name = "file%d%s" % (i, rng.choice(TEXT_TYPES))
+            data = make_text(rng, file_size).encode("UTF-8")
+        if i == 0 and not folder:
+            name = "index.html"
+
+        with open(os.path.join(path, folder, name), "wb") as file:
+            file.write(data)
+        total += len(data)
+    return total
+
+
+class Workspace():
+    """Temporary folders of a benchmark run. Every run gets a new empty
+       output and cache folder, so no run reuses data of a previous one
+       unless it is meant to."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def folder(self, name):
+        self.count += 1
+        path = os.path.join(self.path, "%s%d" % (name, self.count))
+        os.makedirs(path)
+        return path
+
+
+def meta_data(file_data):
+    return {"mode": "wifinina", "ssid": "bench", "pass": "bench", "port": "80",
+            "build_id": get_build_id(file_data)}
+
+
+def make_benchmarks(userio, workspace, input_path, args):
+    # Returns (name, prepare, run) of every benchmark. prepare returns
+    # the arguments of run and is not timed.
+    template_path = get_template_path()
+    options = (args.jobs, args.compress, args.minify)
+
+    def input_data():
+        return get_input_data(userio, input_path, None, *options)
+
+    def warm_cache():
+        cache_path = workspace.folder("cache")
+        manifest = Manifest(cache_path, {"compress": args.compress, "minify": args.minify})
+        get_input_data(userio, input_path, manifest, *options)
+        manifest.save()
+        return cache_path
+
+    def cached_input_data(cache_path):
+        manifest = Manifest(cache_path, {"compress": args.compress, "minify": args.minify})
+        return get_input_data(userio, input_path, manifest, *options)
+
+    def templates_prepare():
+        file_data, mime_data = input_data()
+        return workspace.folder("output"), file_data, mime_data, meta_data(file_data)
+
+    def templates(output_path, file_data, mime_data, meta):
+        generate_from_template(userio, template_path, output_path,
+                               file_data, mime_data, meta, split=args.split)
+
+    def full(output_path, cache_path=None):
+        generate(userio, input_path, output_path, template_path,
+                 {"mode": "wifinina", "ssid": "bench", "pass": "bench", "port": "80"},
+                 cache_path, *options, split=args.split)
+
+    def unchanged_prepare():
+        output_path, cache_path = workspace.folder("output"), workspace.folder("cache")
+        full(output_path, cache_path)
+        return output_path, cache_path
+
+    return [
+        ("get_files_rec", lambda: (), lambda: get_files_rec(input_path)),
+        ("get_input_data", lambda: (), input_data),
+        ("get_input_data (cached)", lambda: (warm_cache(),), cached_input_data),
+        ("generate_from_template", templates_prepare, templates),
+        ("generate", lambda: (workspace.folder("output"),), full),
+        ("generate (unchanged)", unchanged_prepare, full),
+    ]
+
+
+def measure(prepare, run, repeat):
+    # Returns best time of repeat runs and peak memory of an extra run.
+    # Memory is measured separately as tracemalloc slows down the code.
+    best = None
+    for _ in range(repeat):
+        prepared = prepare()
+        start = time.perf_counter()
+        run(*prepared)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    prepared = prepare()
+    tracemalloc.start()
+    try:
+        run(*prepared)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_corpus(name, corpus, args):
+    with tempfile.TemporaryDirectory(prefix="wgen-bench-") as path:
+        input_path = os.path.join(path, "input")
+        size = make_corpus(input_path, **corpus)
+        workspace = Workspace(path)
+        userio = UserIO()
+
+        results = {}
+        for benchmark, prepare, run in make_benchmarks(userio, workspace, input_path, args):
+            if args.benchmark and benchmark not in args.benchmark:
+                continue
+
+            # Output of the generator is not part of the benchmark
+            with contextlib.redirect_stdout(io.StringIO()):
+                seconds, peak = measure(prepare, run, args.repeat)
+            results[benchmark] = {
+                "seconds": seconds,
+                "mb_per_s": size / seconds / (1 << 20),
+                "files_per_s": corpus["files"] / seconds,
+                "peak_bytes": peak,
+            }
+            print("%-14s %-24s %10.2f %10.1f %10.0f %12d" %
+                  (name, benchmark, seconds * 1000, results[benchmark]["mb_per_s"],
+                   results[benchmark]["files_per_s"], peak))
+            sys.stdout.flush()
+        return {"bytes": size, **corpus}, results
+
+
+def compare(baseline, corpora, threshold):
+    # Prints ratios against baseline. Returns True if anything got slower.
+    print()
+    print("Compared to %s (commit %s)" % (baseline.get("version"), baseline.get("commit")))
+    print("%-14s %-24s %10s %10s %10s" %
+          ("Corpus", "Benchmark", "Baseline", "Time", "Memory"))
+
+    regression = False
+    for name, corpus in corpora.items():
+        old_corpus = baseline["corpora"].get(name)
+        if old_corpus is None:
+            continue
+        if old_corpus["parameters"] != corpus["parameters"]:
+            print("%-14s %-24s (different corpus, not compared)" % (name, ""))
+            continue
+
+        for benchmark, result in corpus["results"].items():
+            old = old_corpus["results"].get(benchmark)
+            if old is None:
+                continue
+            time_ratio = result["seconds"] / old["seconds"]
+            memory_ratio = result["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else 1.0
+            slower = time_ratio > 1 + threshold
+            regression = regression or slower
+            print("%-14s %-24s %8.2fms %9.2fx %9.2fx %s" %
+                  (name, benchmark, old["seconds"] * 1000, time_ratio, memory_ratio,
+                   "SLOWER" if slower else ""))
+    return regression
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generator benchmark on synthetic projects")
+    parser.add_argument("--corpus", action="append", choices=sorted(CORPORA),
+                        help="Corpus to run (default: all, can be repeated)")
+    parser.add_argument("--benchmark", action="append", choices=BENCHMARKS,
+                        help="Benchmark to run (default: all, can be repeated)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Factor applied to the number of files of each corpus")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per measurement, best one is reported")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Processes used by get_input_data")
+    parser.add_argument("-z", "--compress", action="store_true",
+                        help="Store text files gzip compressed if smaller")
+    parser.add_argument("--minify", action="store_true",
+                        help="Minify HTML, CSS, JS and JSON files")
+    parser.add_argument("--split", action="store_true",
+                        help="Split assets into separate files")
+    parser.add_argument("--save", metavar="file",
+                        help="Write results as JSON baseline to file")
+    parser.add_argument("--compare", metavar="file",
+                        help="Compare results against JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown reported as regression (default: 0.1)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        if baseline.get("baseline_version") != BASELINE_VERSION:
+            print("Baseline %s has an unsupported format!" % args.compare)
+            exit(1)
+
+    print("%-14s %-24s %10s %10s %10s %12s" %
+          ("Corpus", "Benchmark", "Time (ms)", "MB/s", "Files/s", "Peak (B)"))
+
+    corpora = {}
+    for name in args.corpus or CORPORA:
+        corpus = dict(CORPORA[name])
+        corpus["files"] = max(1, int(corpus["files"] * args.scale))
+        parameters, results = run_corpus(name, corpus, args)
+        corpora[name] = {"parameters": parameters, "results": results}
+
+    report = {
+        "baseline_version": BASELINE_VERSION,
+        "version": __version__,
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"repeat": args.repeat, "jobs": args.jobs, "compress": args.compress,
+                    "minify": args.minify, "split": args.split},
+        "corpora": corpora,
+    }
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=1)
+        print("Results written to " + args.save)
+
+    if baseline is not None:
+        if baseline.get("options") != report["options"]:
+            print("Warning: Baseline was recorded with different options %s"
+                  % baseline.get("options"))
+        if compare(baseline, corpora, args.threshold):
+            print("Benchmarks got slower than the baseline!")
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
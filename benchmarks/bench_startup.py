@@ -0,0 +1,156 @@
+"""Startup benchmark of the wgen command line interface.
+
+Usage: python benchmarks/bench_startup.py [--command name] [--repeat N]
+                                          [--budget-factor factor]
+
+Runs every subcommand in a fresh interpreter with 'python -X importtime'
+and reports the time spent importing modules before the command starts
+its actual work. Commands are run against a project that does not exist,
+so they stop right after loading what they need.
+
+Each command has a budget of import time and a list of slow modules it
+must not import. Absolute times differ a lot between machines, so the
+budget is a multiple of the import time of a reference set of modules
+every command needs (argparse and rich), measured on the same machine.
+Times do not include the imports of a bare interpreter. Exits with 1 if
+any command exceeds its budget or imports one of those modules. Budgets
+can be scaled with --budget-factor."""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Modules only some commands need
+JINJA = "jinja2"
+PROGRESS = "rich.progress"
+TRACEBACK = "rich.traceback"
+MENU = "simple_term_menu"
+GRPC = "grpc"
+ASYNCIO = "asyncio"
+PROCESSES = "concurrent.futures.process"
+
+# None of the commands needs them before it starts working
+SLOW = [JINJA, PROGRESS, TRACEBACK, MENU, GRPC, ASYNCIO, PROCESSES]
+
+# Modules imported by every command. Their import time is the unit of
+# the budgets.
+REFERENCE = "import argparse, getpass, rich.console, rich.table"
+
+# Command line, import budget (multiple of the reference) and modules
+# not to be imported. Project commands get the path of a missing
+# project appended. Measured: version 1.1-1.2, other commands 1.4-1.9.
+# Importing one of the slow modules adds about 0.5 or more.
+COMMANDS = {
+    "version": (["version"], 1.6, SLOW),
+    "init": (["init", "-s", "ssid"], 2.5, SLOW),
+    "generate": (["generate", "-q", "-s", "ssid"], 2.5, SLOW),
+    "build": (["build"], 2.5, SLOW),
+    "watch": (["watch"], 2.5, SLOW),
+    "compile": (["compile"], 2.5, SLOW),
+    "upload": (["upload"], 2.5, SLOW),
+    "size": (["size"], 2.5, SLOW),
+    "serve": (["serve"], 2.5, SLOW),
+    "clean": (["clean"], 2.5, SLOW),
+    "open": (["open"], 2.5, SLOW),
+}
+
+RUNNER = "import sys; from webduino_generator.entrypoint import main; " \
+         "sys.argv = ['wgen'] + sys.argv[1:]; main()"
+
+
+def import_times(arguments):
+    '''Runs python -X importtime with arguments.
+       Returns dict mapping module names to their own import time (us).'''
+
+    # No controlling terminal, so password prompts read from stdin
+    result = subprocess.run([sys.executable, "-X", "importtime"] + arguments,
+                            cwd=ROOT, input="password\n", universal_newlines=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            start_new_session=True)
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(own)
+    return modules
+
+
+def measure(arguments, repeat):
+    # Returns best total import time (ms) and imported modules
+    best = None
+    modules = {}
+    for _ in range(repeat):
+        modules = import_times(arguments)
+        total = sum(modules.values()) / 1000
+        best = total if best is None else min(best, total)
+    return best, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wgen startup benchmark")
+    parser.add_argument("--command", action="append", choices=sorted(COMMANDS),
+                        help="Command to run (default: all, can be repeated)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs per command, best one is reported")
+    parser.add_argument("--budget-factor", type=float, default=1.0,
+                        help="Factor applied to all budgets")
+    parser.add_argument("--slowest", type=int, default=0,
+                        help="Also print the N slowest modules of each command")
+    args = parser.parse_args()
+
+    # Imports of the interpreter itself are not part of the budget
+    interpreter, interpreter_modules = measure(["-c", "pass"], args.repeat)
+    reference, _ = measure(["-c", REFERENCE], args.repeat)
+    reference -= interpreter
+    print("Interpreter imports: %.1f ms" % interpreter)
+    print("Reference imports: %.1f ms" % reference)
+    print()
+    print("%-10s %12s %8s %8s %8s  %s" % ("Command", "Imports (ms)", "Ratio", "Budget",
+                                          "Modules", "Result"))
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="wgen-startup-") as path:
+        missing_project = os.path.join(path, "missing")
+        for name in args.command or COMMANDS:
+            command, budget, forbidden = COMMANDS[name]
+            if name != "version":
+                command = command + [missing_project]
+            budget *= args.budget_factor
+
+            total, modules = measure(["-c", RUNNER] + command, args.repeat)
+            total -= interpreter
+            ratio = total / reference
+            imported = [module for module in forbidden
+                        if any(loaded == module or loaded.startswith(module + ".")
+                               for loaded in modules)]
+
+            problems = []
+            if ratio > budget:
+                problems.append("over budget")
+            if imported:
+                problems.append("imports " + ", ".join(imported))
+            failed = failed or bool(problems)
+
+            print("%-10s %12.1f %8.2f %8.2f %8d  %s" %
+                  (name, total, ratio, budget, len(modules) - len(interpreter_modules),
+                   "; ".join(problems) or "ok"))
+
+            if args.slowest:
+                slowest = sorted(((own, module) for module, own in modules.items()
+                                  if module not in interpreter_modules), reverse=True)
+                for own, module in slowest[:args.slowest]:
+                    print("%-10s %12.1f   %s" % ("", own / 1000, module))
+
+    if failed:
+        print("Startup got slower than its budget!")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,4 +18,5 @@ setup(
                             'wgen=webduino_generator.entrypoint:main'],
     },
     install_requires=["jinja2", "rich", "simple-term-menu"],
+    extras_require={"daemon": ["grpcio"]},
 )
\ No newline at end of file
@@ -0,0 +1,101 @@
+import os
+
+from webduino_generator.daemon import DaemonSession, _SERVICE, _varint, \
+    _message, _decode
+
+
+# Encoding examples of the protobuf documentation
+def test_varint():
+    assert _varint(0) == b"\x00"
+    assert _varint(1) == b"\x01"
+    assert _varint(150) == b"\x96\x01"
+    assert _varint(300) == b"\xac\x02"
+
+
+def test_message():
+    assert _message((1, 150)) == b"\x08\x96\x01"
+    assert _message((2, "testing")) == b"\x12\x07testing"
+    assert _message((3, _message((1, 150)))) == b"\x1a\x03\x08\x96\x01"
+
+
+def test_decode():
+    assert _decode(b"\x08\x96\x01") == {1: [150]}
+    assert _decode(b"\x12\x07testing") == {2: [b"testing"]}
+    assert _decode(b"\x08\x01\x08\x02\x1a\x03\x08\x96\x01") == \
+        {1: [1, 2], 3: [b"\x08\x96\x01"]}
+
+    # Fixed size fields are skipped over
+    assert _decode(b"\x09" + bytes(8) + b"\x15" + bytes(4) + b"\x20\x05") == \
+        {1: [bytes(8)], 2: [bytes(4)], 4: [5]}
+
+
+def test_round_trip():
+    fields = [(1, 2 ** 40), (2, "ä"), (3, b""), (4, _message((1, "x")))]
+    decoded = _decode(_message(*fields))
+    assert decoded == {1: [2 ** 40], 2: ["ä".encode("utf-8")], 3: [b""],
+                       4: [b"\x0a\x01x"]}
+
+
+class FakeChannel():
+    # Stand-in for a grpc channel of a daemon. Records requests and
+    # returns prepared responses.
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def unary_unary(self, method):
+        def call(request):
+            self.requests.append((method, request))
+            return self.responses[method]
+        return call
+
+    def unary_stream(self, method):
+        def call(request):
+            self.requests.append((method, request))
+            return iter(self.responses[method])
+        return call
+
+
+def make_session(responses):
+    session = DaemonSession.__new__(DaemonSession)
+    session.userio = None
+    session.process = None
+    session.channel = FakeChannel(responses)
+    session.instance = b"\x08\x01"  # Instance: id = 1
+    return session
+
+
+def test_board_listall():
+    board = _message((1, "Arduino Uno"), (2, "arduino:avr:uno"))
+    session = make_session({_SERVICE + "BoardListAll": _message((1, board), (1, board))})
+
+    assert session.board_listall() == {"boards": [{"name": "Arduino Uno",
+                                                   "FQBN": "arduino:avr:uno"}] * 2}
+    assert session.channel.requests == [(_SERVICE + "BoardListAll", b"\x0a\x02\x08\x01")]
+
+
+def test_board_list():
+    board = _message((1, "Arduino Uno"), (2, "arduino:avr:uno"))
+    port = _message((1, board), (2, _message((1, "/dev/ttyACM0"))))
+    session = make_session({_SERVICE + "BoardList": _message((1, port))})
+
+    assert session.board_list() == [{"address": "/dev/ttyACM0",
+                                     "boards": [{"name": "Arduino Uno",
+                                                 "FQBN": "arduino:avr:uno"}]}]
+
+
+def test_compile():
+    session = make_session({_SERVICE + "Compile": [_message((1, b"out ")),
+                                                   _message((2, b"err"))]})
+
+    success, output = session.compile("sketch", "arduino:avr:uno", "build",
+                                      capture=True, build_cache_path="cache")
+    assert success
+    assert output == "out err"
+
+    method, request = session.channel.requests[0]
+    assert method == _SERVICE + "Compile"
+    assert request == b"\x0a\x02\x08\x01" + _message(
+        (2, "arduino:avr:uno"), (3, os.path.abspath("sketch")),
+        (6, os.path.abspath("cache")), (7, os.path.abspath("build")))
+    assert _decode(request)[2] == [b"arduino:avr:uno"]
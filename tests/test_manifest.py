@@ -0,0 +1,98 @@
+import os
+
+from webduino_generator.generator import _read_input_file
+from webduino_generator.manifest import Manifest
+
+
+def write(path, text, mtime_ns):
+    with open(path, "w") as file:
+        file.write(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def build(tmp_path, file_name):
+    # Processes and stores a single file as a build does
+    manifest = Manifest(str(tmp_path / "cache"))
+    data, includes, laps, content_hash, stat = _read_input_file(str(tmp_path / "input"),
+                                                                file_name)
+    return manifest, data, content_hash, stat
+
+
+def test_unchanged_file_is_cached(tmp_path):
+    (tmp_path / "input").mkdir()
+    path = str(tmp_path / "input" / "a.txt")
+    write(path, "old", 1000000000)
+
+    manifest, data, content_hash, stat = build(tmp_path, "a.txt")
+    manifest.store("a.txt", path, data, content_hash, stat)
+    manifest.save()
+
+    cached = Manifest(str(tmp_path / "cache")).lookup("a.txt", path)
+    assert str(cached["file_content"]) == "old"
+
+
+def test_file_changed_during_build_is_not_cached(tmp_path):
+    (tmp_path / "input").mkdir()
+    path = str(tmp_path / "input" / "a.txt")
+    write(path, "old", 1000000000)
+
+    # File is saved again after it was read, but before it is stored
+    manifest, data, content_hash, stat = build(tmp_path, "a.txt")
+    write(path, "new!", 2000000000)
+    manifest.store("a.txt", path, data, content_hash, stat)
+    manifest.save()
+
+    assert Manifest(str(tmp_path / "cache")).lookup("a.txt", path) is None
+
+
+def test_touched_file_is_cached(tmp_path):
+    (tmp_path / "input").mkdir()
+    path = str(tmp_path / "input" / "a.txt")
+    write(path, "old", 1000000000)
+
+    manifest, data, content_hash, stat = build(tmp_path, "a.txt")
+    manifest.store("a.txt", path, data, content_hash, stat)
+    manifest.save()
+
+    # Same content with a new mtime
+    write(path, "old", 2000000000)
+    cached = Manifest(str(tmp_path / "cache")).lookup("a.txt", path)
+    assert str(cached["file_content"]) == "old"
+
+
+def test_changed_file_is_read_once(tmp_path, monkeypatch):
+    (tmp_path / "input").mkdir()
+    path = str(tmp_path / "input" / "a.txt")
+    write(path, "old", 1000000000)
+
+    manifest, data, content_hash, stat = build(tmp_path, "a.txt")
+    manifest.store("a.txt", path, data, content_hash, stat)
+    manifest.save()
+
+    # Same size and a new mtime. The content is read to compare hashes
+    # and handed to the reader.
+    write(path, "new", 2000000000)
+    manifest = Manifest(str(tmp_path / "cache"))
+    assert manifest.lookup("a.txt", path) is None
+    content = manifest.pop_content("a.txt")
+    assert content == (b"new", (2000000000, 3))
+
+    monkeypatch.setattr("webduino_generator.generator.read_file", None)
+    data = _read_input_file(str(tmp_path / "input"), "a.txt", content=content)[0]
+    assert data["file_content"] == "new"
+
+
+def test_resized_file_is_not_read(tmp_path, monkeypatch):
+    (tmp_path / "input").mkdir()
+    path = str(tmp_path / "input" / "a.txt")
+    write(path, "old", 1000000000)
+
+    manifest, data, content_hash, stat = build(tmp_path, "a.txt")
+    manifest.store("a.txt", path, data, content_hash, stat)
+    manifest.save()
+
+    write(path, "longer", 2000000000)
+    manifest = Manifest(str(tmp_path / "cache"))
+    monkeypatch.setattr("webduino_generator.manifest.read_file", None)
+    assert manifest.lookup("a.txt", path) is None
+    assert manifest.pop_content("a.txt") is None
@@ -0,0 +1,80 @@
+from webduino_generator.minify import minify, minify_js, minify_css, \
+    minify_json, minify_html
+
+
+def test_js_removes_comments_and_indentation():
+    text = "function f() {\n    // comment\n    return 1; /* block */\n}\n\n\nf();\n"
+    assert minify_js(text) == "function f() {\nreturn 1;\n}\nf();"
+
+
+def test_js_keeps_line_breaks_for_semicolon_insertion():
+    assert minify_js("a = 1\nb = 2\n") == "a = 1\nb = 2"
+
+
+def test_js_keeps_strings():
+    text = "var a = \"  // not a comment  \";\nvar b = '/* neither */';\n"
+    assert minify_js(text) == text.strip()
+
+
+def test_js_keeps_line_continuation_in_strings():
+    text = "var s = \"a\\\n   b\";"
+    assert minify_js(text) == text
+
+
+def test_js_keeps_template_literals():
+    text = "var s = `line1\n    indented\n\n  end`;"
+    assert minify_js("  " + text + "\n") == text
+
+
+def test_js_keeps_regular_expressions():
+    text = "var r = /  [/]* // x/g;\nreturn /a\\/  b/.test(s);"
+    assert minify_js(text) == text
+
+
+def test_js_division_is_not_a_regex():
+    assert minify_js("x = a / b; // half\ny = c / d;") == "x = a / b;\ny = c / d;"
+
+
+def test_css():
+    text = "a  :hover {\n  color: red ;  /* comment */\n  content: \"  x  \";\n}\n"
+    assert minify_css(text) == "a :hover{color:red;content:\"  x  \"}"
+
+
+def test_json():
+    assert minify_json('{ "a": [1, 2],\n "b": "  c  " }') == '{"a":[1,2],"b":"  c  "}'
+    assert minify_json("{ invalid ") == "{ invalid "
+
+
+def test_html_collapses_whitespace_and_removes_comments():
+    text = "<p>\n  Hello   <b>world</b>  <!-- comment -->\n</p>\n"
+    assert minify_html(text) == "<p> Hello <b>world</b> </p>"
+
+
+def test_html_keeps_conditional_comments():
+    text = "<!--[if IE]><p>IE</p><![endif]-->"
+    assert minify_html(text) == text
+
+
+def test_html_keeps_attribute_values():
+    text = "<p  title=\"a   b\"\n   data-x='c\n  d'>Don't   \"quote\"</p>"
+    assert minify_html(text) == "<p title=\"a   b\" data-x='c\n  d'>Don't \"quote\"</p>"
+
+
+def test_html_keeps_pre_and_textarea():
+    text = "<pre>  a\n    b  </pre> <textarea>\n  x  </textarea>"
+    assert minify_html(text) == text
+
+
+def test_html_minifies_inline_script_and_style():
+    text = "<script>\n  // comment\n  var s = `a\n  b`;\n</script>\n<style>\n  p { color: red; }\n</style>"
+    assert minify_html(text) == "<script>var s = `a\n  b`;</script> <style>p{color:red}</style>"
+
+
+def test_html_keeps_script_of_other_types():
+    text = "<script type=\"text/template\">\n  <p>  x  </p>\n</script>"
+    assert minify_html(text) == text
+
+
+def test_minify_by_mime():
+    assert minify("text/plain", "  a  ") == "  a  "
+    assert minify("application/javascript", "  a  ") == "a"
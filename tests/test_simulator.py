@@ -0,0 +1,64 @@
+import gzip
+import io
+
+from webduino_generator.helper import cpp_str_esc, cpp_img_esc
+from webduino_generator.simulator import Simulator, Request, encoding_accepted
+
+
+def test_encoding_accepted():
+    assert encoding_accepted(b"gzip", b"gzip")
+    assert encoding_accepted(b"deflate, GZIP;q=0.5, br", b"gzip")
+    assert encoding_accepted(b"*", b"gzip")
+    assert encoding_accepted(b"*;q=0, gzip", b"gzip")
+
+    assert not encoding_accepted(b"identity", b"gzip")
+    assert not encoding_accepted(b"br", b"gzip")
+    assert not encoding_accepted(b"gzip;q=0", b"gzip")
+    assert not encoding_accepted(b"gzip; q=0.000", b"gzip")
+    assert not encoding_accepted(b"*;q=0", b"gzip")
+    assert not encoding_accepted(b"x-gzip", b"gzip")
+    assert not encoding_accepted(b"", b"gzip")
+
+
+def make_simulator():
+    body = gzip.compress(b"<p>hello</p>")
+    file_data = {
+        cpp_str_esc("index.css"): {
+            "file_type": 3,
+            "mime": cpp_str_esc("text/css"),
+            "file_etag": "3-0123456789abcdef",
+            "file_content": cpp_img_esc(io.BytesIO(body)),
+        },
+    }
+    return Simulator(None, file_data), body
+
+
+def request(accept_encoding=None):
+    result = Request()
+    result.method = b"GET"
+    result.url = b"/index.css"
+    if accept_encoding is not None:
+        result.accept_gzip = encoding_accepted(accept_encoding, b"gzip")
+    return result
+
+
+def test_compressed_without_accept_encoding():
+    simulator, body = make_simulator()
+    response = simulator.respond(request())
+    assert response.startswith(b"HTTP/1.0 200 OK")
+    assert b"Content-Encoding: gzip" in response
+    assert response.endswith(body)
+
+
+def test_compressed_with_gzip():
+    simulator, body = make_simulator()
+    response = simulator.respond(request(b"gzip, deflate"))
+    assert response.startswith(b"HTTP/1.0 200 OK")
+    assert response.endswith(body)
+
+
+def test_compressed_without_gzip():
+    simulator, body = make_simulator()
+    for accept_encoding in (b"identity", b"br", b"gzip;q=0"):
+        response = simulator.respond(request(accept_encoding))
+        assert response.startswith(b"HTTP/1.0 406 Not Acceptable")
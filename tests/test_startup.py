@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "benchmarks"))
+
+from bench_startup import COMMANDS, RUNNER, import_times  # noqa: E402
+
+
+# Only checks which modules are imported. Import times depend on the
+# machine and are left to the benchmark.
+@pytest.mark.parametrize("name", sorted(COMMANDS))
+def test_no_slow_imports(name, tmp_path):
+    command, _, forbidden = COMMANDS[name]
+    if name != "version":
+        command = command + [str(tmp_path / "missing")]
+
+    modules = import_times(["-c", RUNNER] + command)
+    assert modules, "no import times reported"
+    imported = [module for module in forbidden
+                if any(loaded == module or loaded.startswith(module + ".")
+                       for loaded in modules)]
+    assert imported == []
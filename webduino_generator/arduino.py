@@ -1,8 +1,42 @@
 import subprocess
+import atexit
 import json
+import glob
+import time
+import sys
+import os
 
-from simple_term_menu import TerminalMenu
-from .helper import get_tool
+from .helper import get_tool, get_user_cache_path
+
+
+# arduino-cli daemon used instead of running arduino-cli for every
+# command. See use_daemon.
+_daemon = None
+
+# Boards of the catalog cache are listed again after this many seconds,
+# or as soon as arduino-cli or its installed cores change.
+BOARD_CATALOG_VERSION = 2
+BOARD_CATALOG_TTL = 24 * 60 * 60
+
+
+class BoardCatalog():
+    """All boards known to arduino-cli, indexed by FQBN and name."""
+
+    def __init__(self, boards):
+        self.boards = sorted(boards, key=lambda board: board["name"])
+        self.by_fqbn = {board["FQBN"]: board for board in self.boards}
+        self.by_name = {board["name"].lower(): board for board in self.boards}
+
+    def find(self, fqbn):
+        '''Returns board with the FQBN or None. Board options
+           (e.g. "esp32:esp32:esp32:PSRAM=enabled") are ignored.'''
+
+        return self.by_fqbn.get(":".join(fqbn.split(":")[:3]))
+
+    def find_name(self, name):
+        '''Returns board with the name (case insensitive) or None.'''
+
+        return self.by_name.get(name.lower())
 
 
 def get_ide_path(userio):
@@ -25,7 +59,24 @@ def get_cli_path(userio):
     return cli_path
 
 
+def use_daemon(userio, address=None):
+    '''Routes board listing, compile and upload through a long-lived
+       arduino-cli daemon. Starts a daemon for the lifetime of this
+       process unless the address (host:port) of a running one is passed.'''
+
+    global _daemon
+    if _daemon is None:
+        from .daemon import DaemonSession
+        cli_path = None if address else get_cli_path(userio)
+        _daemon = DaemonSession(userio, cli_path, address or None)
+        atexit.register(_daemon.close)
+    return _daemon
+
+
 def get_boards_json(userio, list_all=False):
+    if _daemon is not None:
+        return _daemon.board_listall() if list_all else _daemon.board_list()
+
     cli_path = get_cli_path(userio)
 
     if list_all:
@@ -49,7 +100,68 @@ def get_boards_json(userio, list_all=False):
     return boards
 
 
-def get_boards(userio):
+def get_data_path():
+    # Returns arduino-cli data folder holding the installed cores
+    data_path = os.environ.get("ARDUINO_DIRECTORIES_DATA")
+    if data_path:
+        return data_path
+    if sys.platform == "win32":
+        return os.path.join(os.environ.get("LOCALAPPDATA", ""), "Arduino15")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Arduino15")
+    return os.path.expanduser("~/.arduino15")
+
+
+def get_installed_cores():
+    # Returns installed cores as "vendor/hardware/arch/version" paths.
+    # Listing the folders is much faster than asking arduino-cli.
+    packages = os.path.join(get_data_path(), "packages")
+    return sorted(os.path.relpath(path, packages).replace("\\", "/")
+                  for path in glob.glob(os.path.join(packages, "*", "hardware", "*", "*")))
+
+
+def get_cli_version(cli_path):
+    result = subprocess.run([cli_path, "version", "--format=json"],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        return json.loads(result.stdout.decode('utf-8')).get("VersionString", "")
+    except (ValueError, AttributeError):
+        return ""
+
+
+def get_board_catalog(userio, refresh=False, cached_only=False):
+    '''Returns catalog of all boards. The catalog is cached and only
+       listed by arduino-cli again if it is outdated or refresh is True.
+       If cached_only is True, arduino-cli is never run: a cached catalog
+       is used regardless of its age and None is returned if there is
+       none.'''
+
+    # Checking the key must be cheap, so it does not run arduino-cli.
+    # A new arduino-cli binary changes its modification time.
+    cli_path = get_cli_path(userio)
+    try:
+        cli_mtime = os.stat(cli_path).st_mtime_ns
+    except OSError:
+        cli_mtime = None
+    key = {"cli": cli_path,
+           "cli_mtime": cli_mtime,
+           "cores": get_installed_cores()}
+    cache_path = os.path.join(get_user_cache_path(), "boards.json")
+
+    if not refresh:
+        try:
+            with open(cache_path, "r") as file:
+                cache = json.load(file)
+            if cache.get("version") == BOARD_CATALOG_VERSION and \
+               cache.get("key") == key and \
+               (cached_only or 0 <= time.time() - cache.get("created", 0) < BOARD_CATALOG_TTL):
+                userio.print("Using cached board catalog " + cache_path, verbose=True)
+                return BoardCatalog(cache["boards"])
+        except (OSError, ValueError, KeyError):
+            pass
+    if cached_only and not refresh:
+        return None
+
     boards = get_boards_json(userio, True)
 
     # arduino-cli board listall packes the result in a dict
@@ -61,13 +173,29 @@ def get_boards(userio):
     boards = [board for board in boards if "name" in board]
     boards = [board for board in boards if "FQBN" in board]
 
-    # Sort boards for the user
-    boards = sorted(boards, key=lambda board: board["name"])
+    # Only keep what is used to select and validate boards
+    boards = [{"name": board["name"], "FQBN": board["FQBN"]} for board in boards]
 
     userio.print("Dumping processed arduino-cli response:", verbose=True)
     userio.print(boards, verbose=True)
 
-    return boards
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w") as file:
+            json.dump({"version": BOARD_CATALOG_VERSION,
+                       "key": key,
+                       "cli_version": get_cli_version(cli_path),
+                       "created": time.time(),
+                       "boards": boards}, file)
+    except OSError:
+        userio.warn("Could not write board catalog cache " + cache_path)
+
+    return BoardCatalog(boards)
+
+
+def get_boards(userio, refresh=False):
+    # Boards sorted by name for the user
+    return get_board_catalog(userio, refresh).boards
 
 
 def get_boards_connected(userio):
@@ -100,17 +228,15 @@ def get_boards_connected(userio):
     return processed
 
 
-def get_board(userio):
-    boards = get_boards(userio)
+def get_board(userio, refresh=False):
+    boards = get_boards(userio, refresh)
 
     if len(boards) == 0:
         userio.error("No boards found!")
 
     # Query user to select a board
-    userio.print("Please select target board:")
-    terminal_menu = TerminalMenu([board["name"] for board in boards], menu_highlight_style=None)
-
-    selection = terminal_menu.show()
+    selection = userio.select("Please select target board:",
+                              [board["name"] for board in boards])
 
     # Menu cancled by user
     if selection is None:
@@ -130,11 +256,9 @@ def get_board_connected(userio):
         userio.error("No boards found!")
 
     # Query user to select a board
-    userio.print("Please select target board:")
-    terminal_menu = TerminalMenu([board["address"] + ": " + board["name"]
-                                 for board in boards], menu_highlight_style=None)
-
-    selection = terminal_menu.show()
+    selection = userio.select("Please select target board:",
+                              [board["address"] + ": " + board["name"]
+                               for board in boards])
 
     # Menu cancled by user
     if selection is None:
@@ -147,13 +271,50 @@ def get_board_connected(userio):
     return board["name"], board["FQBN"], board["address"]
 
 
-def sketch_compile(userio, sketch_path, fqbn):
-    # Compile sketch
+def get_board_properties(userio, sketch_path, fqbn):
+    # Returns build properties of a board as "key=value" lines.
+    # Empty if arduino-cli could not resolve them.
     cli_path = get_cli_path(userio)
-    subprocess.run([cli_path, "compile", "--fqbn", fqbn, sketch_path])
-
-
-def sketch_upload(userio, sketch_path, fqbn, address):
-    # Upload sketch
+    result = subprocess.run([cli_path, "compile", "--fqbn", fqbn, "--show-properties",
+                             sketch_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        userio.print("Could not get properties of " + fqbn, verbose=True)
+        userio.print(result.stderr.decode("utf-8", "replace"), verbose=True)
+        return ""
+    return result.stdout.decode("utf-8", "replace")
+
+
+def _run_cli(args, capture):
+    # Runs arduino-cli. Returns success and the output if captured.
+    if not capture:
+        return subprocess.run(args).returncode == 0, None
+    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return result.returncode == 0, result.stdout.decode("utf-8", "replace")
+
+
+def sketch_compile(userio, sketch_path, fqbn, build_path=None, capture=False,
+                   build_cache_path=None):
+    # Compile sketch. Returns success and the output if captured.
+    # Objects are kept in build_path, compiled cores in build_cache_path.
+    if _daemon is not None:
+        return _daemon.compile(sketch_path, fqbn, build_path, capture,
+                               build_cache_path)
+    cli_path = get_cli_path(userio)
+    args = [cli_path, "compile", "--fqbn", fqbn]
+    if build_path is not None:
+        args += ["--build-path", build_path]
+    if build_cache_path is not None:
+        args += ["--build-cache-path", build_cache_path]
+    return _run_cli(args + [sketch_path], capture)
+
+
+def sketch_upload(userio, sketch_path, fqbn, address, build_path=None, capture=False):
+    # Upload sketch. Returns success and the output if captured.
+    # The sketch is uploaded from build_path if it was compiled there.
+    if _daemon is not None:
+        return _daemon.upload(sketch_path, fqbn, address, build_path, capture)
     cli_path = get_cli_path(userio)
-    subprocess.run([cli_path, "upload", "-p", address, "--fqbn", fqbn, sketch_path])
+    args = [cli_path, "upload", "-p", address, "--fqbn", fqbn]
+    if build_path is not None:
+        args += ["--input-dir", build_path]
+    return _run_cli(args + [sketch_path], capture)
@@ -0,0 +1,227 @@
+import subprocess
+import socket
+import sys
+import os
+
+try:
+    import grpc
+except ImportError:
+    grpc = None
+
+
+# The daemon speaks gRPC (cc.arduino.cli.commands.v1). Only a handful of
+# small messages are needed, so they are encoded by hand instead of
+# depending on the generated protobuf modules of arduino-cli.
+_SERVICE = "/cc.arduino.cli.commands.v1.ArduinoCoreService/"
+
+
+def _varint(value):
+    data = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            data.append(byte | 0x80)
+        else:
+            data.append(byte)
+            return bytes(data)
+
+
+def _message(*fields):
+    # Encodes (number, value) pairs. Strings and bytes (including encoded
+    # sub messages) are length delimited, ints are varints.
+    data = bytearray()
+    for number, value in fields:
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        if isinstance(value, bytes):
+            data += _varint(number << 3 | 2) + _varint(len(value)) + value
+        else:
+            data += _varint(number << 3) + _varint(int(value))
+    return bytes(data)
+
+
+def _read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, offset
+
+
+def _decode(data):
+    # Returns dict mapping field numbers to lists of values. Length
+    # delimited values are returned as bytes.
+    fields = {}
+    offset = 0
+    while offset < len(data):
+        key, offset = _read_varint(data, offset)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, offset = _read_varint(data, offset)
+        elif wire_type == 2:
+            length, offset = _read_varint(data, offset)
+            value = data[offset:offset + length]
+            offset += length
+        elif wire_type == 1:
+            value = data[offset:offset + 8]
+            offset += 8
+        elif wire_type == 5:
+            value = data[offset:offset + 4]
+            offset += 4
+        else:
+            raise ValueError("Unsupported protobuf wire type %d" % wire_type)
+        fields.setdefault(number, []).append(value)
+    return fields
+
+
+def _string(fields, number):
+    return fields.get(number, [b""])[0].decode("utf-8")
+
+
+def _board(data):
+    # BoardListItem: name = 1, fqbn = 2
+    fields = _decode(data)
+    return {"name": _string(fields, 1), "FQBN": _string(fields, 2)}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class DaemonSession():
+    """Long-lived arduino-cli daemon. The core index and toolchains are
+       loaded once and reused for every following request.
+       Either starts a daemon (which is stopped again by close) or
+       connects to an already running one."""
+
+    def __init__(self, userio, cli_path=None, address=None):
+        if grpc is None:
+            userio.error("Using the arduino-cli daemon requires grpcio. "
+                         "Install it with 'pip install grpcio'.")
+
+        self.userio = userio
+        self.process = None
+        self.channel = None
+
+        if address is None:
+            port = _free_port()
+            userio.print("Starting arduino-cli daemon on port %d" % port, verbose=True)
+            self.process = subprocess.Popen([cli_path, "daemon", "--port", str(port)],
+                                            stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL)
+            address = "127.0.0.1:%d" % port
+
+        self.channel = grpc.insecure_channel(address)
+        try:
+            grpc.channel_ready_future(self.channel).result(timeout=30)
+        except grpc.FutureTimeoutError:
+            self.close()
+            userio.error("Could not connect to arduino-cli daemon at " + address)
+        userio.print("Connected to arduino-cli daemon at " + address, verbose=True)
+
+        # Create and initialize instance (loads index and installed cores)
+        response = _decode(self.call("Create", b""))
+        self.instance = response[1][0]
+        for response in self.stream("Init", _message((1, self.instance))):
+            error = _decode(response).get(2)
+            if error:
+                userio.warn("arduino-cli daemon: " + _string(_decode(error[0]), 2))
+
+    def call(self, method, request):
+        try:
+            return self.channel.unary_unary(_SERVICE + method)(request)
+        except grpc.RpcError as error:
+            self.userio.error("arduino-cli daemon: %s failed: %s"
+                              % (method, error.details()))
+
+    def stream(self, method, request):
+        try:
+            yield from self.channel.unary_stream(_SERVICE + method)(request)
+        except grpc.RpcError as error:
+            self.userio.error("arduino-cli daemon: %s failed: %s"
+                              % (method, error.details()))
+
+    def board_listall(self):
+        '''Returns all boards in the format of 'board listall --format=json'.'''
+
+        response = _decode(self.call("BoardListAll", _message((1, self.instance))))
+        return {"boards": [_board(board) for board in response.get(1, [])]}
+
+    def board_list(self):
+        '''Returns connected boards in the format of 'board list --format=json'.'''
+
+        response = _decode(self.call("BoardList", _message((1, self.instance))))
+        ports = []
+        for detected_port in response.get(1, []):
+            # DetectedPort: matching_boards = 1, port = 2 (address = 1)
+            detected_port = _decode(detected_port)
+            port = _decode(detected_port.get(2, [b""])[0])
+            ports.append({"address": _string(port, 1),
+                          "boards": [_board(board)
+                                     for board in detected_port.get(1, [])]})
+        return ports
+
+    def _run(self, method, request, capture):
+        # Forwards out_stream (1) and err_stream (2) of streamed responses
+        # to the console or collects them. Returns success and the output
+        # if captured.
+        output = []
+        success = True
+        try:
+            for response in self.channel.unary_stream(_SERVICE + method)(request):
+                response = _decode(response)
+                for number, stream in ((1, sys.stdout), (2, sys.stderr)):
+                    for data in response.get(number, []):
+                        if capture:
+                            output.append(data.decode("utf-8", "replace"))
+                        else:
+                            stream.buffer.write(data)
+                            stream.flush()
+        except grpc.RpcError as error:
+            message = "arduino-cli daemon: %s failed: %s\n" % (method, error.details())
+            if capture:
+                output.append(message)
+            else:
+                sys.stderr.write(message)
+            success = False
+        return success, "".join(output) if capture else None
+
+    def compile(self, sketch_path, fqbn, build_path=None, capture=False,
+                build_cache_path=None):
+        # CompileRequest: instance = 1, fqbn = 2, sketch_path = 3,
+        # build_cache_path = 6, build_path = 7
+        fields = [(1, self.instance), (2, fqbn), (3, os.path.abspath(sketch_path))]
+        if build_cache_path is not None:
+            fields.append((6, os.path.abspath(build_cache_path)))
+        if build_path is not None:
+            fields.append((7, os.path.abspath(build_path)))
+        return self._run("Compile", _message(*fields), capture)
+
+    def upload(self, sketch_path, fqbn, address, build_path=None, capture=False):
+        # UploadRequest: instance = 1, fqbn = 2, sketch_path = 3, port = 4,
+        # import_dir = 8
+        port = _message((1, address), (3, "serial"))
+        fields = [(1, self.instance), (2, fqbn), (3, os.path.abspath(sketch_path)),
+                  (4, port)]
+        if build_path is not None:
+            fields.append((8, os.path.abspath(build_path)))
+        return self._run("Upload", _message(*fields), capture)
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
@@ -1,13 +1,13 @@
 import argparse
-import subprocess
-import json
+import sys
+import os
 
 from .__init__ import __version__, __website__
 from .userio import UserIO, get_ssid_pass
-from .helper import cpp_str_esc, cpp_img_esc, get_files_rec, shorten, get_tool
-from .project import Project
-from .arduino import get_ide_path
-from .generator import *
+
+# Only modules needed to parse the arguments are imported up front.
+# Commands import the (slow to import) modules they need themselves,
+# so e.g. 'wgen version' does not load jinja2 or the arduino tooling.
 
 
 def command_version(userio, args):
@@ -15,7 +15,20 @@ def command_version(userio, args):
     userio.print(__website__)
 
 
+def check_jobs(userio, args):
+    # Zero jobs means one per CPU
+    if args.jobs < 0:
+        userio.error("Invalid number of jobs!")
+    if args.jobs == 0:
+        args.jobs = os.cpu_count() or 1
+
+
 def command_generate(userio, args):
+    from .generator import generate, get_template_path
+
+    # Check jobs
+    check_jobs(userio, args)
+
     # Check port
     if args.port < 0 or args.port > 65535:
         userio.error("Invalid port!")
@@ -43,20 +56,75 @@ def command_generate(userio, args):
     }
 
     # Eventually create output
-    generate(userio, args.input, args.output, args.template, meta_data)
+    generate(userio, args.input, args.output, args.template, meta_data,
+             jobs=args.jobs, compress=args.compress, minify=args.minify,
+             split=args.split)
 
 
 def command_init(userio, args):
+    from .project import Project
     Project.create_project(userio, args.target, args.force,
                            args.mode, args.ssid, args.port)
 
 
 def command_build(userio, args):
+    from .project import Project
+    check_jobs(userio, args)
+
+    project = Project(userio, args.target)
+    project.generate(args.quiet, args.jobs, args.compress, args.minify,
+                     profile=args.profile, capture=args.cprofile, split=args.split)
+
+
+def command_watch(userio, args):
+    from .project import Project
+    check_jobs(userio, args)
+
+    if args.debounce < 0:
+        userio.error("Invalid debounce time!")
+
+    check_daemon(userio, args)
+    project = Project(userio, args.target)
+    project.watch(args.quiet, args.jobs, args.compress, args.minify,
+                  compile=args.compile, debounce=args.debounce,
+                  polling=args.poll, split=args.split)
+
+
+def command_clean(userio, args):
+    from .project import Project
+    project = Project(userio, args.target)
+    project.clean(args.all)
+
+
+def command_size(userio, args):
+    from .project import Project
+    check_jobs(userio, args)
+    check_daemon(userio, args)
+
+    project = Project(userio, args.target)
+    project.size(args.jobs, args.compress, args.minify, args.fqbn, args.compile)
+
+
+def command_serve(userio, args):
+    from .project import Project
+    check_jobs(userio, args)
+
+    if args.port < 0 or args.port > 65535:
+        userio.error("Invalid port!")
+    if args.bandwidth is not None and args.bandwidth <= 0:
+        userio.error("Invalid bandwidth!")
+    if args.chunk_size is not None and args.chunk_size <= 0:
+        userio.error("Invalid chunk size!")
+
     project = Project(userio, args.target)
-    project.generate(args.quiet)
+    project.serve(args.host, args.port, args.jobs, args.compress, args.minify,
+                  args.bandwidth, args.chunk_size)
 
 
 def command_open(userio, args):
+    from .project import Project
+    from .arduino import get_ide_path
+    import subprocess
     userio.section("Opening project output")
 
     # Get project output location
@@ -78,18 +146,52 @@ def command_open(userio, args):
         subprocess.call([ide_path, sketch_path])
 
 
+def check_daemon(userio, args):
+    # A running daemon is used if its address is passed.
+    # Otherwise a daemon is started for this command.
+    if args.daemon or args.daemon_address:
+        from .arduino import use_daemon
+        use_daemon(userio, args.daemon_address)
+
+
 def command_compile(userio, args):
+    from .project import Project
+    check_jobs(userio, args)
+    check_daemon(userio, args)
+
+    # Boards passed as comma separated list
+    fqbns = None
+    if args.fqbn is not None:
+        fqbns = [fqbn.strip() for fqbn in args.fqbn.split(",") if fqbn.strip()]
+        if not fqbns:
+            userio.error("No board passed!")
+
     project = Project(userio, args.target)
-    project.compile(save=args.save, force_select=args.select_device)
+    project.compile(save=args.save, force_select=args.select_device,
+                    profile=args.profile, refresh_boards=args.refresh_boards,
+                    fqbns=fqbns, jobs=args.jobs)
 
 
 def command_upload(userio, args):
+    from .project import Project
+    check_jobs(userio, args)
+    check_daemon(userio, args)
     project = Project(userio, args.target)
-    project.upload()
+    if args.all:
+        project.upload_all(args.jobs)
+    else:
+        project.upload()
+
+
+def excepthook(type, value, traceback):
+    # Rich tracebacks are slow to import. Only load them on errors.
+    from rich.traceback import install
+    install()
+    sys.excepthook(type, value, traceback)
 
 
 def main():
-    install_traceback()
+    sys.excepthook = excepthook
     userio = UserIO()
 
     #
@@ -121,6 +223,18 @@ def main():
     parser_generate.add_argument("-o", "--output", metavar="folder", type=str,
                                  default=".", dest='output',
                                  help="location of the output folder (default: ./output/)")
+    parser_generate.add_argument("-j", "--jobs", metavar="N", type=int,
+                                 default=1, dest='jobs',
+                                 help="Number of processes used to process input files (0: one per CPU)")
+    parser_generate.add_argument("-z", "--compress",
+                                 action="store_true", dest='compress',
+                                 help="Store text files gzip compressed if smaller")
+    parser_generate.add_argument("--minify",
+                                 action="store_true", dest='minify',
+                                 help="Remove comments and whitespace from HTML, CSS, JS and JSON files")
+    parser_generate.add_argument("--split",
+                                 action="store_true", dest='split',
+                                 help="Write each static file to its own .cpp file, so only changed files are compiled again")
 
     parser_init = subparsers.add_parser("init", help="Create new project in current working directory")
     parser_init.add_argument("target", metavar="target", type=str,
@@ -146,6 +260,59 @@ def main():
     parser_build.add_argument("-q", "--quiet",
                               action="store_true", dest='quiet',
                               help="Hides password warning")
+    parser_build.add_argument("-j", "--jobs", metavar="N", type=int,
+                              default=1, dest='jobs',
+                              help="Number of processes used to process input files (0: one per CPU)")
+    parser_build.add_argument("-z", "--compress",
+                              action="store_true", dest='compress',
+                              help="Store text files gzip compressed if smaller")
+    parser_build.add_argument("--minify",
+                              action="store_true", dest='minify',
+                              help="Remove comments and whitespace from HTML, CSS, JS and JSON files")
+    parser_build.add_argument("--split",
+                              action="store_true", dest='split',
+                              help="Write each static file to its own .cpp file, so only changed files are compiled again")
+    parser_build.add_argument("--profile",
+                              action="store_true", dest='profile',
+                              help="Time build phases and write a report to .wgen/profile/")
+    parser_build.add_argument("--cprofile",
+                              action="store_true", dest='cprofile',
+                              help="Also capture cProfile statistics of the build")
+
+    parser_watch = subparsers.add_parser("watch", help="Rebuild current project whenever input or template files change")
+    parser_watch.add_argument("target", metavar="target", type=str,
+                              default=".", nargs="?",
+                              help="Root folder of target project")
+    parser_watch.add_argument("-q", "--quiet",
+                              action="store_true", dest='quiet',
+                              help="Hides password warning")
+    parser_watch.add_argument("-j", "--jobs", metavar="N", type=int,
+                              default=1, dest='jobs',
+                              help="Number of processes used to process input files (0: one per CPU)")
+    parser_watch.add_argument("-z", "--compress",
+                              action="store_true", dest='compress',
+                              help="Store text files gzip compressed if smaller")
+    parser_watch.add_argument("--minify",
+                              action="store_true", dest='minify',
+                              help="Remove comments and whitespace from HTML, CSS, JS and JSON files")
+    parser_watch.add_argument("--split",
+                              action="store_true", dest='split',
+                              help="Write each static file to its own .cpp file, so only changed files are compiled again")
+    parser_watch.add_argument("-c", "--compile",
+                              action="store_true", dest='compile',
+                              help="Also compile the project after each build")
+    parser_watch.add_argument("--debounce", metavar="seconds", type=float,
+                              default=0.2, dest='debounce',
+                              help="Time without further changes before rebuilding (default: 0.2)")
+    parser_watch.add_argument("--poll",
+                              action="store_true", dest='poll',
+                              help="Poll for changes instead of using inotify")
+    parser_watch.add_argument("--daemon",
+                              action="store_true", dest='daemon',
+                              help="Start an arduino-cli daemon for this command and send all requests to it. It is stopped when the command ends (requires grpcio)")
+    parser_watch.add_argument("--daemon-address", metavar="host:port", type=str,
+                              default="", dest='daemon_address',
+                              help="Send all requests to an already running arduino-cli daemon, which keeps its caches between runs (requires grpcio)")
 
     parser_open = subparsers.add_parser("open", help="Open generated code in arduino ide")
     parser_open.add_argument("target", metavar="target", type=str,
@@ -165,11 +332,101 @@ def main():
     parser_compile.add_argument("--save",
                                 action="store_true", dest='save',
                                 help="Safe selected target to project files")
+    parser_compile.add_argument("--profile",
+                                action="store_true", dest='profile',
+                                help="Time compilation and write a report to .wgen/profile/")
+    parser_compile.add_argument("--fqbn", metavar="fqbn", type=str,
+                                default=None, dest='fqbn',
+                                help="Compile for these boards (comma separated FQBNs) in parallel instead of the project target")
+    parser_compile.add_argument("-j", "--jobs", metavar="N", type=int,
+                                default=0, dest='jobs',
+                                help="Number of boards compiled at the same time (default 0: one per CPU)")
+    parser_compile.add_argument("--refresh-boards",
+                                action="store_true", dest='refresh_boards',
+                                help="List boards again instead of using the cached board catalog")
+    parser_compile.add_argument("--daemon",
+                                action="store_true", dest='daemon',
+                                help="Start an arduino-cli daemon for this command and send all requests to it. It is stopped when the command ends (requires grpcio)")
+    parser_compile.add_argument("--daemon-address", metavar="host:port", type=str,
+                                default="", dest='daemon_address',
+                                help="Send all requests to an already running arduino-cli daemon, which keeps its caches between runs (requires grpcio)")
 
     parser_upload = subparsers.add_parser("upload", help="Upload Arduino code from current project")
     parser_upload.add_argument("target", metavar="target", type=str,
                                default=".", nargs="?",
                                help="Root folder of target project")
+    parser_upload.add_argument("-a", "--all",
+                               action="store_true", dest='all',
+                               help="Compile for and upload to all connected boards in parallel")
+    parser_upload.add_argument("-j", "--jobs", metavar="N", type=int,
+                               default=0, dest='jobs',
+                               help="Number of boards compiled and uploaded at the same time (default 0: one per CPU)")
+    parser_upload.add_argument("--daemon",
+                               action="store_true", dest='daemon',
+                               help="Start an arduino-cli daemon for this command and send all requests to it. It is stopped when the command ends (requires grpcio)")
+    parser_upload.add_argument("--daemon-address", metavar="host:port", type=str,
+                               default="", dest='daemon_address',
+                               help="Send all requests to an already running arduino-cli daemon, which keeps its caches between runs (requires grpcio)")
+
+    parser_size = subparsers.add_parser("size", help="Report flash used by the files of current project")
+    parser_size.add_argument("target", metavar="target", type=str,
+                             default=".", nargs="?",
+                             help="Root folder of target project")
+    parser_size.add_argument("-j", "--jobs", metavar="N", type=int,
+                             default=1, dest='jobs',
+                             help="Number of processes used to process input files (0: one per CPU)")
+    parser_size.add_argument("-z", "--compress",
+                             action="store_true", dest='compress',
+                             help="Store text files gzip compressed if smaller")
+    parser_size.add_argument("--minify",
+                             action="store_true", dest='minify',
+                             help="Remove comments and whitespace from HTML, CSS, JS and JSON files")
+    parser_size.add_argument("--fqbn", metavar="fqbn", type=str,
+                             default=None, dest='fqbn',
+                             help="Board to compare against instead of the project target")
+    parser_size.add_argument("-c", "--compile",
+                             action="store_true", dest='compile',
+                             help="Also compile and report the actual flash and RAM usage")
+    parser_size.add_argument("--daemon",
+                             action="store_true", dest='daemon',
+                             help="Start an arduino-cli daemon for this command and send all requests to it. It is stopped when the command ends (requires grpcio)")
+    parser_size.add_argument("--daemon-address", metavar="host:port", type=str,
+                             default="", dest='daemon_address',
+                             help="Send all requests to an already running arduino-cli daemon, which keeps its caches between runs (requires grpcio)")
+
+    parser_serve = subparsers.add_parser("serve", help="Serve the files of current project as the board would (without hardware)")
+    parser_serve.add_argument("target", metavar="target", type=str,
+                              default=".", nargs="?",
+                              help="Root folder of target project")
+    parser_serve.add_argument("--host", metavar="host", type=str,
+                              default="127.0.0.1", dest='host',
+                              help="Address to listen on")
+    parser_serve.add_argument("-p", "--port", metavar="port", type=int,
+                              default=8080, dest='port',
+                              help="Port to listen on")
+    parser_serve.add_argument("-j", "--jobs", metavar="N", type=int,
+                              default=1, dest='jobs',
+                              help="Number of processes used to process input files (0: one per CPU)")
+    parser_serve.add_argument("-z", "--compress",
+                              action="store_true", dest='compress',
+                              help="Store text files gzip compressed if smaller")
+    parser_serve.add_argument("--minify",
+                              action="store_true", dest='minify',
+                              help="Remove comments and whitespace from HTML, CSS, JS and JSON files")
+    parser_serve.add_argument("--bandwidth", metavar="bytes/s", type=int,
+                              default=None, dest='bandwidth',
+                              help="Limit the output to emulate the WiFi module (e.g. 100000)")
+    parser_serve.add_argument("--chunk-size", metavar="bytes", type=int,
+                              default=None, dest='chunk_size',
+                              help="Bytes per write if the bandwidth is limited (default: 32 if the project target is an AVR board, else 1024)")
+
+    parser_clean = subparsers.add_parser("clean", help="Delete build folders of current project")
+    parser_clean.add_argument("target", metavar="target", type=str,
+                              default=".", nargs="?",
+                              help="Root folder of target project")
+    parser_clean.add_argument("-a", "--all",
+                              action="store_true", dest='all',
+                              help="Also delete cached input files and templates")
 
     parser_version = subparsers.add_parser("version", help="Display current version")
 
@@ -179,6 +436,15 @@ def main():
         group.add_argument("-v", "--verbose",
                            action="store_true", dest='verbose',
                            help="Enable verbose output")
+        group.add_argument("--ci",
+                           action="store_true", dest='ci',
+                           help="Never prompt and show no progress bars. Credentials are read "
+                                "from WGEN_SSID, WGEN_PASSWORD or WGEN_PASSWORD_FILE "
+                                "(default if the CI environment variable is set)")
+        group.add_argument("-y", "--yes",
+                           action="store_true", dest='yes',
+                           help="Delete files without asking, e.g. existing output. "
+                                "Required for deletions in non-interactive mode")
 
     #
     # Check arguments
@@ -186,12 +452,15 @@ def main():
     args = parser.parse_args()
     if hasattr(args, "verbose"):
         userio.verbose = args.verbose
+    if getattr(args, "ci", False) or os.environ.get("CI", "").lower() not in ("", "0", "false"):
+        userio.interactive = False
+    userio.assume_yes = getattr(args, "yes", False)
 
     userio.print("[bold]Stone Labs. Webduino Gernerator\n")
 
     userio.print("Dumping arguments", verbose=True)
     userio.quick_table("", ["Argument", "Value"],
-                       [[arg, getattr(args, arg)] for arg in vars(args)],
+                       lambda: [[arg, getattr(args, arg)] for arg in vars(args)],
                        verbose=True)
 
     def handle():
@@ -204,10 +473,18 @@ def main():
             command_init(userio, args)
         elif args.command == "build":
             command_build(userio, args)
+        elif args.command == "watch":
+            command_watch(userio, args)
         elif args.command == "compile":
             command_compile(userio, args)
         elif args.command == "upload":
             command_upload(userio, args)
+        elif args.command == "size":
+            command_size(userio, args)
+        elif args.command == "serve":
+            command_serve(userio, args)
+        elif args.command == "clean":
+            command_clean(userio, args)
         elif args.command == "open":
             command_open(userio, args)
         elif args.command == "generate":
@@ -0,0 +1,87 @@
+import re
+
+
+# Names of the file types used in fileData
+FILE_TYPES = {0: "static", 1: "binary", 2: "dynamic", 3: "compressed"}
+
+# Size report printed by arduino-cli after compiling
+_FLASH_USAGE = re.compile(r"Sketch uses (\d+) bytes .*?Maximum is (\d+) bytes")
+_RAM_USAGE = re.compile(r"Global variables use (\d+) bytes .*?Maximum is (\d+) bytes")
+
+# Board properties holding the limits
+_FLASH_LIMIT = re.compile(r"^upload\.maximum_size=(\d+)\s*$", re.MULTILINE)
+_RAM_LIMIT = re.compile(r"^upload\.maximum_data_size=(\d+)\s*$", re.MULTILINE)
+
+
+class _CountingWriter():
+    # Stream counting the UTF-8 bytes written to it
+    def __init__(self):
+        self.size = 0
+
+    def write(self, text):
+        self.size += len(text.encode("UTF-8"))
+
+
+def get_source_size(file_content):
+    '''Returns size of the escaped content in the generated source.
+       Lazily generated content is streamed, not kept in memory.'''
+
+    if hasattr(file_content, "write_to"):
+        writer = _CountingWriter()
+        file_content.write_to(writer)
+        return writer.size
+    return len(str(file_content).encode("UTF-8"))
+
+
+def get_progmem_size(data):
+    '''Returns bytes an asset occupies in PROGMEM. Strings are stored
+       with a terminating zero. Dynamic content is code and not counted.'''
+
+    if data["file_type"] == 0:
+        return data["file_size"] + 1
+    if data["file_type"] in (1, 3):
+        return data["file_size"]
+    return 0
+
+
+def get_asset_footprint(file_data):
+    '''Returns footprint of each asset in fileData, largest first.'''
+
+    assets = []
+    for file_name, data in file_data.items():
+        assets.append({
+            "name": file_name,
+            "type": FILE_TYPES.get(data["file_type"], str(data["file_type"])),
+            "raw_size": data["raw_size"],
+            "minified_size": data["minified_size"],
+            "compressed": data["file_type"] == 3,
+            "source_size": get_source_size(data["file_content"]),
+            "progmem_size": get_progmem_size(data),
+        })
+    return sorted(assets, key=lambda asset: asset["progmem_size"], reverse=True)
+
+
+def parse_size_output(output):
+    '''Parses the size report of arduino-cli compile.
+       Returns dict with (used, maximum) bytes for "flash" and "ram".
+       Missing entries are left out.'''
+
+    usage = {}
+    for name, pattern in (("flash", _FLASH_USAGE), ("ram", _RAM_USAGE)):
+        match = pattern.search(output)
+        if match is not None:
+            usage[name] = (int(match.group(1)), int(match.group(2)))
+    return usage
+
+
+def parse_board_limits(properties):
+    '''Parses board properties (arduino-cli compile --show-properties).
+       Returns dict with maximum bytes for "flash" and "ram".
+       Missing entries are left out.'''
+
+    limits = {}
+    for name, pattern in (("flash", _FLASH_LIMIT), ("ram", _RAM_LIMIT)):
+        match = pattern.search(properties)
+        if match is not None:
+            limits[name] = int(match.group(1))
+    return limits
@@ -1,13 +1,19 @@
 import mimetypes
 import hashlib
 import shutil
+import io
 import os
+import re
+
+from concurrent.futures import as_completed
 
 from .userio import UserIO
-from .helper import cpp_str_esc, cpp_img_esc, get_files_rec, shorten
-from jinja2 import Template
-from rich.traceback import install as install_traceback
-from rich.progress import Progress, BarColumn, TextColumn
+from .helper import cpp_str_esc, cpp_img_esc, get_files_rec, shorten, replace_if_changed, \
+    gzip_compress, read_file, CppArrayBuffer
+from .manifest import Manifest
+from .symbols import Symbols
+from .minify import minify as minify_text, MINIFIERS
+from .profiler import BuildProfiler, Stopwatch
 
 
 def get_template_path():
@@ -20,23 +26,235 @@ def get_demo_path():
     return os.path.join(install_dir, "demo")
 
 
+# Template rendered once per static, binary and compressed file if assets
+# are split into separate translation units. Not rendered otherwise.
+ASSET_TEMPLATE = "asset.cpp"
+
+# Template environments by template folder and bytecode cache folder.
+# Kept for the lifetime of the process, so templates are only compiled once.
+_template_environments = {}
+
+
+def cpp_array_filter(data):
+    # Jinja2 filter converting bytes into a C array initializer
+    return cpp_img_esc(io.BytesIO(data))
+
+
+class PayloadStream():
+    """Writes template output to a file. Lazily generated payloads (objects
+       with a write_to method, e.g. CppArrayBuffer or CachedPayload) are not
+       converted to strings while rendering. The environment's finalize hook
+       replaces them with placeholders that are resolved by streaming the
+       payload straight into the output file."""
+
+    _placeholder = re.compile(r"\x00wgen:(\d+)\x00")
+
+    def __init__(self):
+        self.payloads = []
+
+    def finalize(self, value):
+        if hasattr(type(value), "write_to"):
+            self.payloads.append(value)
+            return "\x00wgen:%d\x00" % (len(self.payloads) - 1)
+        return value
+
+    def write(self, chunks, output):
+        '''Writes rendered chunks to output and resolves placeholders.'''
+
+        try:
+            for chunk in chunks:
+                if "\x00" not in chunk:
+                    output.write(chunk)
+                    continue
+
+                # Parts alternate between text and payload index
+                parts = self._placeholder.split(chunk)
+                for i, part in enumerate(parts):
+                    if i % 2 == 0:
+                        output.write(part)
+                    else:
+                        self.payloads[int(part)].write_to(output)
+        finally:
+            self.payloads = []
+
+
+def get_template_environment(template_path, cache_path=None):
+    # Returns jinja2 environment loading templates from template_path.
+    # Compiled templates are cached in cache_path if it is not None.
+    # The environment's payload_stream writes rendered templates to disk.
+    key = (os.path.abspath(template_path), cache_path)
+    if key not in _template_environments:
+        from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+
+        bytecode_cache = None
+        if cache_path is not None:
+            bytecode_folder = os.path.join(cache_path, "jinja")
+            os.makedirs(bytecode_folder, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_folder)
+
+        payload_stream = PayloadStream()
+        environment = Environment(loader=FileSystemLoader(template_path),
+                                  bytecode_cache=bytecode_cache,
+                                  finalize=payload_stream.finalize)
+        environment.payload_stream = payload_stream
+        environment.filters["cpp_str"] = cpp_str_esc
+        environment.filters["cpp_array"] = cpp_array_filter
+        _template_environments[key] = environment
+
+    return _template_environments[key]
+
+
 def delete_folder_safe(userio, output_path):
     # Deletes folder after user confirmation
     # returns False on failure
     if os.path.exists(output_path):
         folder = os.path.abspath(output_path)
         userio.warn("Folder " + folder + " exists!")
-        userio.print("Press Enter to delete. Ctrl+C to cancel!")
-        try:
-            input()
-            shutil.rmtree(folder)
-            return True
-        except KeyboardInterrupt:
+        if not userio.confirm("Press Enter to delete. Ctrl+C to cancel!",
+                              "delete " + folder):
             return False
+        shutil.rmtree(folder)
     return True
 
 
-def get_input_data(userio, input_path):
+def get_mime(file_name):
+    # Returns MIME type of file
+    mime, encoding = mimetypes.guess_type(file_name)
+
+    # https://stackoverflow.com/questions/1176022/unknown-file-type-mime
+    # Not generating a Content-Type header entry would be the best solution
+    # but is not feasible with the current system
+    if mime is None:
+        mime = "application/octet-stream"
+
+    return mime
+
+
+# Bytes checked for zero bytes when sniffing the type of a file
+SNIFF_SIZE = 1024
+
+
+def sniff_file_type(file_name, data):
+    # Returns file type of the raw file content and its text (None for
+    # binary files). Text files never contain zero bytes, so most binary
+    # files are detected without decoding them. The rest is binary if
+    # it is not valid UTF-8.
+    if b"\0" in data[:SNIFF_SIZE]:
+        return 1, None  # Binary content
+
+    try:
+        text = data.decode("UTF-8")
+    except UnicodeDecodeError:
+        return 1, None  # Binary content
+
+    # Same line endings as reading in text mode
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+    if file_name.endswith(".cpp"):
+        return 2, text  # Dynamic content
+    return 0, text  # Static content
+
+
+def _read_input_file(input_path, file_name, compress=False, minify=False,
+                     content=None):
+    # Reads, minifies and escapes a single input file.
+    # The file is read once. The same buffer is used to detect its type,
+    # to find includes, to compute the ETag and to create the content.
+    # content is (bytes, stat) of the file if it was already read.
+    # Returns file data (type, sizes, ETag and content), the line
+    # numbers of includes, the time spent on each step, the content
+    # hash and the (mtime, size) of the file when it was read.
+    # Does not use userio, so it can be run in a worker process.
+    watch = Stopwatch()
+    file_path = os.path.join(input_path, file_name)
+    includes = []
+
+    raw, stat = content or read_file(file_path)
+    raw_size = len(raw)
+    minified_size = raw_size
+    watch.lap("read")
+
+    file_type, text = sniff_file_type(file_name, raw)
+    watch.lap("sniff")
+
+    if file_type == 2:
+        # Find includes to warn user about
+        for line_num, line in enumerate(text.split("\n"), 1):
+            if line.startswith("#include "):
+                includes.append(line_num)
+
+        # Handle dynamic content (cpp files)
+        file_content = text.replace("\n", "\n\t")
+        file_size = 0
+        stored = raw
+        watch.lap("escape")
+    elif file_type == 0:
+        # Normal static page. The raw bytes are used unless the text
+        # had to be changed.
+        body = raw if b"\r" not in raw else text.encode("UTF-8")
+        if minify:
+            body = minify_text(get_mime(file_name), text).encode("UTF-8")
+            minified_size = len(body)
+            watch.lap("minify")
+        file_size = len(body)
+
+        # Store compressed data instead if it is smaller
+        compressed = None
+        if compress:
+            compressed = gzip_compress(body)
+            watch.lap("compress")
+        if compressed is not None and len(compressed) < file_size:
+            file_content = cpp_img_esc(io.BytesIO(compressed))
+            file_size = len(compressed)
+            file_type = 3  # Compressed static content
+            stored = compressed
+        else:
+            file_content = cpp_str_esc(body)
+            stored = body
+        watch.lap("escape")
+    else:
+        # The C array is only created when the template is rendered
+        file_content = CppArrayBuffer(raw)
+        file_size = raw_size
+        stored = raw
+
+    # Strong ETag of the bytes that are sent, i.e. after minifying,
+    # normalizing line endings and compressing. Changes with the content
+    # and with the way it is stored.
+    content_hash = hashlib.sha1(raw).hexdigest()
+    stored_hash = content_hash if stored is raw else hashlib.sha1(stored).hexdigest()
+    file_etag = "%d-%s" % (file_type, stored_hash[:16])
+    watch.lap("hash")
+
+    data = {
+        "file_type": file_type,
+        "raw_size": raw_size,
+        "minified_size": minified_size,
+        "file_size": file_size,
+        "file_etag": file_etag,
+        "file_content": file_content
+    }
+    return data, includes, watch.laps, content_hash, stat
+
+
+def _warn_includes(userio, file_name, includes):
+    # Warn user when using includes
+    for line_num in includes:
+        userio.print("")
+        userio.warn(file_name + " line " + str(line_num) + ":")
+        userio.print("| Putting includes in input files is not recommended!")
+        userio.print("| This might cause conflicts or large sketch sizes!")
+        userio.print("| Please put them in the template files instead.")
+
+
+def get_input_data(userio, input_path, manifest=None, jobs=1, compress=False,
+                   minify=False, profiler=None, symbols=None):
+    if profiler is None:
+        profiler = BuildProfiler("generate")
+    if symbols is None:
+        symbols = Symbols()
+
     # Get list of all files
     files = get_files_rec(input_path)
     userio.print("Processing " + str(len(files)) + " files...", verbose=True)
@@ -45,17 +263,16 @@ def get_input_data(userio, input_path):
     files = sorted(files)
 
     userio.quick_table("", ["Input Files"],
-                       [[_file] for _file in files], verbose=True)
+                       lambda: [[_file] for _file in files], verbose=True)
 
     # Data input functions
     def _addFile(container):
-        def inner(file_name, file_hash, mime, mime_hash, file_content, file_type):
+        def inner(file_name, file_hash, mime, mime_hash, data):
             entry = {
                 "file_hash": file_hash,
                 "mime": mime,
                 "mime_hash": mime_hash,
-                "file_type": file_type,
-                "file_content": file_content
+                **data
             }
             container[file_name] = entry
             return container
@@ -76,137 +293,199 @@ def get_input_data(userio, input_path):
     mimeData = {}
     addMime = _addMime(mimeData)
 
+    # Data of each file, filled in order of completion
+    contents = {}
+
     # Process files
-    progress_current = TextColumn("Initializing...")
-    with Progress(BarColumn(),
-                  "[progress.percentage]{task.percentage:>3.1f}%",
-                  "[progress.description]{task.description}") as progress:
+    with userio.progress() as progress:
         task1 = progress.add_task("Converting", total=len(files), start=True)
 
-        for file_name in files:
-            # Update progress bar
-            progress.tasks[task1].description = file_name
-
-            # Save mime hash and type
-            mime, encoding = mimetypes.guess_type(file_name)
-
-            # https://stackoverflow.com/questions/1176022/unknown-file-type-mime
-            # Not generating a Content-Type header entry would be the best solution
-            # but is not feasible with the current system
-            if mime is None:
-                mime = "application/octet-stream"
-
-            mime_hash = hashlib.sha1(mime.encode("UTF-8")).hexdigest()
-            mime_hash = mime_hash[:10]
-
-            # Get file hash
-            file_hash = hashlib.sha1(file_name.encode("UTF-8")).hexdigest()
-            file_hash = file_hash[:10]
-
-            # Variable to hold file content
-            file_content = ""
-            file_type = 0
-
-            try:
-                # Try to handle file non-binary UTF-8 file.
-                with open(os.path.join(input_path, file_name), 'r', encoding="UTF-8") as file:
-                    if (file_name.endswith(".cpp")):
-                        # Warn user when using includes
-                        line_num = 0
-                        for line in file.readlines():
-                            line_num += 1
-                            if line.startswith("#include "):
-                                userio.print("")
-                                userio.warn(file_name + " line " + str(line_num) + ":")
-                                userio.print("| Putting includes in input files is not recommended!")
-                                userio.print("| This might cause conflicts or large sketch sizes!")
-                                userio.print("| Please put them in the template files instead.")
-
-                        # Handle dynamic content (cpp files)
-                        file_content = file.read().replace("\n", "\n\t")
-                        file_type = 2  # Dynamic content
-                    else:
-                        # Normal static page
-                        file_content = cpp_str_esc(file.read())
-            except UnicodeDecodeError:
-                # Encode as binary if UTF-8 fails
-                with open(os.path.join(input_path, file_name), 'rb') as file:
-                    file_content = cpp_img_esc(file)
-                    file_type = 1  # Binary content
-
-            # Save file for processing after all files were read
-            addFile(cpp_str_esc(file_name),
-                    file_hash,
-                    cpp_str_esc(mime),
-                    mime_hash,
-                    file_content,
-                    file_type)
-
-            addMime(cpp_str_esc(mime),
-                    mime_hash)
-
+        def advance(file_name):
             # Update progress bar
-            progress.update(task1, advance=1)
+            progress.update(task1, description=file_name, advance=1)
+
+        def processed(file_name, data, includes, laps, content_hash, stat):
+            # Store result of a file that was read and escaped
+            _warn_includes(userio, file_name, includes)
+            if manifest is not None:
+                watch = Stopwatch()
+                data = manifest.store(file_name,
+                                      os.path.join(input_path, file_name), data,
+                                      content_hash, stat)
+                watch.lap("cache")
+                laps.update(watch.laps)
+            contents[file_name] = data
+            profiler.add_file(file_name, laps, data["raw_size"], data["file_size"])
+            advance(file_name)
+
+        # Reuse escaped content of unchanged files
+        pending = []
+        for file_name in files:
+            cached = None
+            if manifest is not None:
+                watch = Stopwatch()
+                cached = manifest.lookup(file_name, os.path.join(input_path, file_name))
+                watch.lap("cache")
+
+            if cached is not None:
+                contents[file_name] = cached
+                profiler.add_file(file_name, watch.laps, cached["raw_size"],
+                                  cached["file_size"], cached=True)
+                advance(file_name)
+            else:
+                # Changed files read by the cache check are not read again
+                content = None
+                if manifest is not None:
+                    content = manifest.pop_content(file_name)
+                pending.append((file_name, content))
+
+        # Read and escape remaining files. Either sequentially or in a
+        # pool of worker processes
+        if jobs > 1 and len(pending) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = {executor.submit(_read_input_file, input_path, file_name,
+                                           compress, minify, content): file_name
+                           for file_name, content in pending}
+                for future in as_completed(futures):
+                    processed(futures[future], *future.result())
+        else:
+            for file_name, content in pending:
+                processed(file_name, *_read_input_file(input_path, file_name,
+                                                       compress, minify, content))
 
         # All files processed
-        progress.tasks[task1].description = "Done"
+        progress.update(task1, description="Done")
+
+    # Collect data in sorted order, independent of completion order
+    for file_name in files:
+        # Get identifiers of file and MIME type used in the generated code.
+        # (Still called hashes, as templates refer to them by that name.)
+        mime = get_mime(file_name)
+        mime_hash = symbols.mimes.get(mime)
+        file_hash = symbols.files.get(file_name)
+
+        # Save file for processing after all files were read
+        addFile(cpp_str_esc(file_name),
+                file_hash,
+                cpp_str_esc(mime),
+                mime_hash,
+                contents[file_name])
+
+        addMime(cpp_str_esc(mime),
+                mime_hash)
 
     return fileData, mimeData
 
 
+def get_build_id(file_data):
+    # Returns hash over names and ETags of all files
+    sha1 = hashlib.sha1()
+    for file_name, data in file_data.items():
+        sha1.update((file_name + "\0" + data["file_etag"] + "\0").encode("UTF-8"))
+    return sha1.hexdigest()[:16]
+
+
 def generate_from_template(userio, template_path, output_path,
-                           file_data, mime_data, meta_data):
+                           file_data, mime_data, meta_data, incremental=False,
+                           profiler=None, cache_path=None, split=False):
+    if profiler is None:
+        profiler = BuildProfiler("generate")
+
     userio.print("Creating output folder", verbose=True)
 
-    # Prepare output folder
+    # Prepare output folder. Incremental builds keep the previous output
+    # and only rewrite files whose content changed.
     outputFolder = os.path.join(output_path, "main/")
     try:
-        os.mkdir(outputFolder)
+        if not incremental or not os.path.isdir(outputFolder):
+            os.mkdir(outputFolder)
     except OSError:
         userio.error("Could not create output directory!")
 
-    # Get list of all template files
-    files = get_files_rec(template_path)
+    # Get list of all template files. Files starting with an underscore
+    # can be included or extended by other templates but are not rendered.
+    files = {file_name for file_name in get_files_rec(template_path)
+             if not os.path.basename(file_name).startswith("_")}
     userio.print("Processing " + str(len(files)) + " template files...", verbose=True)
 
+    # Output file name, template and additional template data of each
+    # output file. Split builds render the asset template for each asset.
+    context = {"fileData": file_data,
+               "mimeData": mime_data,
+               "metaData": meta_data,
+               "splitAssets": split}
+    outputs = [(file_name, file_name, {}) for file_name in sorted(files - {ASSET_TEMPLATE})]
+    if split:
+        if ASSET_TEMPLATE not in files:
+            userio.error("Template folder has no %s. It is required to split assets."
+                         % ASSET_TEMPLATE)
+        outputs += [("asset_%s.cpp" % data["file_hash"], ASSET_TEMPLATE,
+                     {"file": file, "data": data})
+                    for file, data in file_data.items()
+                    if data["file_type"] in (0, 1, 3)]
+
+    environment = get_template_environment(template_path, cache_path)
+
+    # Remove output files of deleted templates and assets
+    if incremental:
+        for file_name in get_files_rec(outputFolder) - {output[0] for output in outputs}:
+            userio.print("Removing stale output file " + file_name, verbose=True)
+            os.remove(os.path.join(outputFolder, file_name))
+
     userio.quick_table("",
                        ["Template Files"],
-                       [[_file] for _file in files], verbose=True)
+                       lambda: [[_file] for _file in files], verbose=True)
 
     # Process each file
-    progress_current = TextColumn("Initializing...")
-    with Progress(BarColumn(),
-                  "[progress.percentage]{task.percentage:>3.1f}%",
-                  "[progress.description]{task.description}") as progress:
-        task1 = progress.add_task("Converting", total=len(files), start=True)
+    with userio.progress() as progress:
+        task1 = progress.add_task("Converting", total=len(outputs), start=True)
 
-        for file_name in files:
+        unchanged = 0
+        for file_name, template_name, extra in outputs:
             # Update progress bar
-            progress.tasks[task1].description = file_name
+            progress.update(task1, description=file_name)
 
-            # Get input and output path
-            file_name_input = os.path.join(template_path, file_name)
+            # Get output path
             file_name_output = os.path.join(outputFolder, file_name)
 
-            # Open handles for input and output files
-            with open(file_name_input, "r") as file_input, \
-                 open(file_name_output, "w") as file_output:
-
-                # Apply jinja2 processing and write processed file to output
-                template = Template(file_input.read())
-                file_output.write(template.render(fileData=file_data,
-                                                  mimeData=mime_data,
-                                                  metaData=meta_data))
+            # Apply jinja2 processing
+            watch = Stopwatch()
+            template = environment.get_template(template_name)
+            watch.lap("compile")
+            # Render straight to a temporary file next to the output, so the
+            # output never has to be kept in memory as a whole.
+            temp_name = file_name_output + ".tmp"
+            with open(temp_name, "w", encoding="UTF-8") as file:
+                environment.payload_stream.write(
+                    template.generate(**context, **extra), file)
+            bytes_out = os.path.getsize(temp_name)
+            watch.lap("render")
+
+            # Move processed file to output. Unchanged files are not
+            # touched so arduino-cli can reuse its build cache.
+            if not replace_if_changed(temp_name, file_name_output):
+                unchanged += 1
+            watch.lap("write")
+            profiler.add_template(file_name, watch.laps, bytes_out)
 
             # Update progress bar
             progress.update(task1, advance=1)
 
         # All files processed
-        progress.tasks[task1].description = "Done"
+        progress.update(task1, description="Done")
+
+    if incremental:
+        userio.print("%d of %d output files unchanged" % (unchanged, len(outputs)))
 
 
 def generate(userio, input_path, output_path, template_path,
-             meta_data):
+             meta_data, cache_path=None, jobs=1, compress=False, minify=False,
+             profiler=None, split=False):
+    # Builds are incremental if a cache folder is passed.
+    # Otherwise the complete output is regenerated.
+    if profiler is None:
+        profiler = BuildProfiler("generate")
 
     # Verbose print generation
     userio.print("\nGenerating with following arguments:", verbose=True)
@@ -233,25 +512,69 @@ def generate(userio, input_path, output_path, template_path,
         userio.error("Invalid template path!")
 
     # Clear previous output
-    if not delete_folder_safe(userio, os.path.join(output_path, "main/")):
-        userio.error("Can't continue with existing output folder")
+    manifest = None
+    symbols = Symbols()
+    if cache_path is None:
+        if not delete_folder_safe(userio, os.path.join(output_path, "main/")):
+            userio.error("Can't continue with existing output folder")
+    else:
+        with profiler.phase("load cache"):
+            manifest = Manifest(cache_path, {"compress": compress, "minify": minify})
+            symbols = Symbols(os.path.join(cache_path, "symbols.json"))
 
     # Process input
     userio.section("Processing input files...")
-    file_data, mime_data = get_input_data(userio, input_path)
+    with profiler.phase("process input"):
+        file_data, mime_data = get_input_data(userio, input_path, manifest, jobs,
+                                              compress, minify, profiler, symbols)
+
+    if manifest is not None:
+        userio.print("Reused %d cached files, processed %d files"
+                     % (manifest.hits, manifest.misses))
+
+    # Report bytes saved by minification
+    if minify:
+        minified = [[file_name, data["raw_size"], data["minified_size"],
+                     data["raw_size"] - data["minified_size"]]
+                    for file_name, data in file_data.items()
+                    if data["file_type"] in (0, 3) and data["mime"] in MINIFIERS]
+        userio.quick_table("Minified Files",
+                           ["File name", "Raw size", "Minified size", "Saved"],
+                           minified, verbose=True)
+        userio.print("Minified %d files, saving %d bytes"
+                     % (len(minified), sum(row[3] for row in minified)))
+
+    # Report flash saved by compression
+    if compress:
+        compressed = [[file_name, data["minified_size"], data["file_size"],
+                       data["minified_size"] - data["file_size"]]
+                      for file_name, data in file_data.items()
+                      if data["file_type"] == 3]
+        userio.quick_table("Compressed Files",
+                           ["File name", "Size", "Compressed size", "Saved"],
+                           compressed, verbose=True)
+        userio.print("Compressed %d files, saving %d bytes of flash"
+                     % (len(compressed), sum(row[3] for row in compressed)))
 
     # Pack meta data
     meta_data = {key: cpp_str_esc(value)
                  for key, value in meta_data.items()}
 
-    # Print all data that can be used in jinja2 files processed
+    # Build id changes whenever any served file changes
+    meta_data["build_id"] = get_build_id(file_data)
+    userio.print("Build id: " + meta_data["build_id"], verbose=True)
+
+    # Print all data that can be used in jinja2 files processed.
+    # Rows are only created in verbose mode, as shortening the content
+    # converts lazily generated payloads to strings.
     userio.print("\nListing data available to the templates:", verbose=True)
     userio.quick_table("File Data",
-                       ["File name", "File hash", "File MIME",
-                        "MIME hash", "File type", "File content"],
-                       [[file_name, *[shorten(value, 100)
-                                      for value in file_data_struct.values()]]
-                        for (file_name, file_data_struct) in file_data.items()],
+                       ["File name", "File hash", "File MIME", "MIME hash", "File type",
+                        "Raw size", "Minified size", "File size", "File ETag",
+                        "File content"],
+                       lambda: [[file_name, *[shorten(value, 100)
+                                              for value in file_data_struct.values()]]
+                                for (file_name, file_data_struct) in file_data.items()],
                        verbose=True)
 
     userio.quick_table("MIME Data",
@@ -264,5 +587,15 @@ def generate(userio, input_path, output_path, template_path,
 
     # Now, find and process Template files
     userio.section("Writing program files...")
-    generate_from_template(userio, template_path, output_path,
-                           file_data, mime_data, meta_data)
+    with profiler.phase("process templates"):
+        generate_from_template(userio, template_path, output_path,
+                               file_data, mime_data, meta_data,
+                               incremental=manifest is not None,
+                               profiler=profiler, cache_path=cache_path,
+                               split=split)
+
+    # Remember processed files for the next build
+    if manifest is not None:
+        with profiler.phase("save cache"):
+            manifest.save()
+            symbols.save()
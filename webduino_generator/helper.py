@@ -1,22 +1,170 @@
+import filecmp
+import hashlib
+import gzip
+import io
 import os
+import re
 
 from shutil import which
 
 
-def cpp_str_esc(s, encoding='ascii'):
-    if isinstance(s, bytes):
-        s = s.encode(encoding)
-    result = ''
-    for c in s:
-        if not (32 <= ord(c) < 127) or c in ('\\', '"'):
-            result += '\\%03o' % ord(c)
-        else:
-            result += c
-    return result
+def _cpp_esc_pairs(codes):
+    # Backslash has to be escaped first as every escape sequence
+    # introduces new backslashes
+    codes = sorted(codes, key=lambda code: code != ord('\\'))
+    return [(chr(code), '\\%03o' % code) for code in codes
+            if not (32 <= code < 127) or chr(code) in ('\\', '"')]
+
+
+# (character, escape sequence) pairs of all ASCII characters to be escaped
+_CPP_STR_ESC_ASCII = _cpp_esc_pairs(range(128))
+
+# Same for raw bytes, covering all 256 values
+_CPP_STR_ESC_BYTES = [(char.encode('latin-1'), escaped.encode('ascii'))
+                      for char, escaped in _cpp_esc_pairs(range(256))]
+
+# Escape sequence of every byte value that has to be escaped
+_CPP_STR_ESC_BYTE_MAP = {char[0]: escaped for char, escaped in _CPP_STR_ESC_BYTES}
+
+# Bytes that are not escaped
+_CPP_STR_PLAIN_BYTES = bytes(code for code in range(256)
+                             if code not in _CPP_STR_ESC_BYTE_MAP)
+
+# C array representation of every byte value
+_CPP_HEX_TABLE = ["0x%x," % byte for byte in range(256)]
+
+# Bytes read per chunk and bytes written per row by cpp_img_esc_stream
+_CPP_ARRAY_CHUNK_SIZE = 64 * 1024
+_CPP_ARRAY_ROW_SIZE = 32
+
+# Matches all non-ASCII characters
+_CPP_STR_ESC_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+
+def _cpp_str_esc_char(match):
+    return '\\%03o' % ord(match.group())
+
+
+def cpp_str_esc(s):
+    """Escapes text for use inside a C string literal.
+       Characters outside of printable ASCII as well as backslashes and
+       double quotes are replaced by octal escape sequences.
+       Bytes are escaped byte by byte. Runs in linear time."""
+
+    if isinstance(s, (bytes, bytearray, memoryview)):
+        s = bytes(s)
+        # Only replace bytes that actually occur. Deleting all plain
+        # bytes leaves them in a single pass.
+        present = set(s.translate(None, _CPP_STR_PLAIN_BYTES))
+        for code in sorted(present, key=lambda code: code != ord('\\')):
+            s = s.replace(bytes((code,)), _CPP_STR_ESC_BYTE_MAP[code])
+        return s.decode('ascii')
+
+    for char, escaped in _CPP_STR_ESC_ASCII:
+        if char in s:
+            s = s.replace(char, escaped)
+    if not s.isascii():
+        s = _CPP_STR_ESC_NON_ASCII.sub(_cpp_str_esc_char, s)
+    return s
 
 
 def cpp_img_esc(file):
-    return "{{{0}}}".format("".join(["0x%x," % byte for byte in file.read()]))
+    """Returns content of binary file object as C array initializer."""
+
+    with io.StringIO() as buffer:
+        cpp_img_esc_stream(file, buffer)
+        return buffer.getvalue()
+
+
+def cpp_img_esc_stream(file, output, chunk_size=_CPP_ARRAY_CHUNK_SIZE):
+    """Writes content of binary file object as C array initializer
+       to output. The file is read in chunks of chunk_size bytes and
+       every chunk is written as rows of hex bytes."""
+
+    output.write("{")
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        for row in range(0, len(chunk), _CPP_ARRAY_ROW_SIZE):
+            output.write("\n")
+            output.write("".join(map(_CPP_HEX_TABLE.__getitem__,
+                                     chunk[row:row + _CPP_ARRAY_ROW_SIZE])))
+    output.write("}")
+
+
+class CppArrayBuffer():
+    """Binary data that is converted to a C array initializer on demand.
+       Keeps the (large) escaped content out of memory until it is
+       written to the output."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def write_to(self, output):
+        cpp_img_esc_stream(io.BytesIO(self.data), output)
+
+    def __str__(self):
+        with io.StringIO() as buffer:
+            self.write_to(buffer)
+            return buffer.getvalue()
+
+
+def gzip_compress(data):
+    """Returns gzip compressed data. Output is deterministic."""
+
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def read_file(path):
+    """Returns content of file and (modification time in ns, size) of
+       the file. The file is stat'ed before it is read, so changes made
+       while it is read leave it newer than the returned time."""
+
+    with open(path, "rb") as file:
+        stat = os.fstat(file.fileno())
+        data = file.read()
+    return data, (stat.st_mtime_ns, stat.st_size)
+
+
+def hash_file(path):
+    """Returns SHA-1 hex digest of file content."""
+
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def get_object_files(folders):
+    """Returns modification times of all object files and archives
+       (.o, .a) in folders. Files deleted while the folders are listed
+       are left out."""
+
+    files = {}
+    for folder in folders:
+        for dir_, _, files_ in os.walk(folder):
+            for file_name in files_:
+                if file_name.endswith((".o", ".a")):
+                    path = os.path.join(dir_, file_name)
+                    try:
+                        files[path] = os.stat(path).st_mtime_ns
+                    except OSError:
+                        continue
+    return files
+
+
+def is_inside(path, parent):
+    """Returns True if path is parent or inside of it.
+       Symbolic links are resolved."""
+
+    path, parent = os.path.realpath(path), os.path.realpath(parent)
+    try:
+        return os.path.commonpath([path, parent]) == parent
+    except ValueError:
+        # Paths on different drives
+        return False
 
 
 def get_files_rec(parent):
@@ -34,8 +182,32 @@ def get_files_rec(parent):
     return files
 
 
+def replace_if_changed(temp_path, path):
+    """Moves temp_path to path unless path already has the same content.
+       In that case temp_path is deleted and path is not touched.
+       Returns True if path was replaced."""
+
+    if os.path.isfile(path) and filecmp.cmp(temp_path, path, shallow=False):
+        os.remove(temp_path)
+        return False
+
+    os.replace(temp_path, path)
+    return True
+
+
 def shorten(text, maxLength):
-    return str(text)[:maxLength] + ("..." if maxLength < len(str(text)) else "")
+    text = str(text)
+    return text[:maxLength] + ("..." if maxLength < len(text) else "")
+
+
+def get_user_cache_path():
+    """Returns folder for data cached across projects."""
+
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "webduino-generator")
 
 
 def get_tool(name):
@@ -0,0 +1,177 @@
+import hashlib
+import shutil
+import json
+import os
+
+from .__init__ import __version__
+from .helper import hash_file, read_file
+
+
+class CachedPayload():
+    """Escaped file content stored in the build cache. The content is only
+       read when the object is converted to a string or written to a
+       stream."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write_to(self, output):
+        with open(self.path, "r", encoding="UTF-8", newline="") as file:
+            shutil.copyfileobj(file, output)
+
+    def __str__(self):
+        with open(self.path, "r", encoding="UTF-8", newline="") as file:
+            return file.read()
+
+
+class Manifest():
+    """Content hash manifest of all input files of the last build.
+       Escaped payloads of processed files are kept next to the manifest
+       so unchanged files do not have to be read and escaped again.
+       A read only manifest uses the cache but never changes it."""
+
+    version = 6
+
+    def __init__(self, cache_path, settings=None, read_only=False):
+        self.cache_path = cache_path
+        self.read_only = read_only
+        self.settings = dict(settings or {}, generator=__version__)
+        self.files = {}
+        self.used = set()
+        self.contents = {}
+        self.hits = 0
+        self.misses = 0
+
+        self.load()
+
+    def get_manifest_path(self):
+        return os.path.join(self.cache_path, "manifest.json")
+
+    def get_payload_folder_path(self):
+        return os.path.join(self.cache_path, "payloads")
+
+    def get_payload_path(self, content_hash, file_type):
+        return os.path.join(self.get_payload_folder_path(),
+                            "%s-%d" % (content_hash, file_type))
+
+    def load(self):
+        '''Reads manifest of previous build. Discards it if it was
+           created with different settings.'''
+
+        try:
+            with open(self.get_manifest_path(), "r") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        if manifest.get("version") != self.version or \
+           manifest.get("settings") != self.settings:
+            return
+
+        self.files = manifest.get("files", {})
+
+    def save(self):
+        '''Writes manifest and deletes payloads that are no longer used.'''
+
+        if self.read_only:
+            return
+
+        # Forget files that were not part of this build
+        self.files = {file_name: entry
+                      for file_name, entry in self.files.items()
+                      if file_name in self.used}
+
+        os.makedirs(self.cache_path, exist_ok=True)
+        with open(self.get_manifest_path(), "w") as file:
+            json.dump({"version": self.version,
+                       "settings": self.settings,
+                       "files": self.files}, file, indent=1, sort_keys=True)
+
+        payloads = {os.path.basename(self.get_payload_path(entry["hash"],
+                                                           entry["data"]["file_type"]))
+                    for entry in self.files.values()}
+        payload_folder = self.get_payload_folder_path()
+        if os.path.isdir(payload_folder):
+            for payload in os.listdir(payload_folder):
+                if payload not in payloads:
+                    os.remove(os.path.join(payload_folder, payload))
+
+    def lookup(self, file_name, path):
+        '''Returns file data of the cached file or None if the file
+           changed since the last build.
+           Files with unchanged mtime and size are not read at all.
+           Files with a new mtime but the same size are read and hashed.
+           If they changed, their content is kept for pop_content, so
+           they do not have to be read again.'''
+
+        self.used.add(file_name)
+
+        stat = os.stat(path)
+        entry = self.files.get(file_name)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry["size"] != stat.st_size:
+            self.misses += 1
+            return None
+
+        if entry["mtime"] != stat.st_mtime_ns:
+            # File was touched. Check whether content actually changed.
+            content, content_stat = read_file(path)
+            if hashlib.sha1(content).hexdigest() != entry["hash"]:
+                self.contents[file_name] = (content, content_stat)
+                self.misses += 1
+                return None
+            entry["mtime"], entry["size"] = content_stat
+
+        payload_path = self.get_payload_path(entry["hash"], entry["data"]["file_type"])
+        if not os.path.isfile(payload_path):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return dict(entry["data"], file_content=CachedPayload(payload_path))
+
+    def pop_content(self, file_name):
+        '''Returns (content, (mtime, size)) of a changed file read by
+           lookup, or None if lookup did not read it.'''
+
+        return self.contents.pop(file_name, None)
+
+    def store(self, file_name, path, data, content_hash=None, stat=None):
+        '''Saves file data and escaped file content to the cache.
+           Returns file data with the content replaced by the cached
+           payload. The file is hashed unless its hash is passed.
+           stat is the (mtime, size) of the file when it was read. It
+           has to be taken before reading, otherwise a change made in
+           the meantime would be stored as the processed version.
+           Returns file data unchanged if the manifest is read only.'''
+
+        self.used.add(file_name)
+        if self.read_only:
+            return data
+
+        if stat is None:
+            stat = os.stat(path)
+            stat = (stat.st_mtime_ns, stat.st_size)
+        content_hash = content_hash or hash_file(path)
+        file_content = data["file_content"]
+        self.files[file_name] = {
+            "mtime": stat[0],
+            "size": stat[1],
+            "hash": content_hash,
+            "data": {key: value for key, value in data.items()
+                     if key != "file_content"},
+        }
+
+        # Write payload. Lazily generated content is streamed to disk.
+        payload_path = self.get_payload_path(content_hash, data["file_type"])
+        os.makedirs(self.get_payload_folder_path(), exist_ok=True)
+        with open(payload_path, "w", encoding="UTF-8", newline="") as file:
+            if hasattr(file_content, "write_to"):
+                file_content.write_to(file)
+            else:
+                file.write(file_content)
+
+        return dict(data, file_content=CachedPayload(payload_path))
@@ -0,0 +1,252 @@
+import json
+import re
+
+
+# Conservative minifiers for text files. They only remove comments and
+# whitespace that can not change the meaning of the file. If in doubt,
+# content is left untouched.
+
+
+def _skip_string(text, start):
+    # Returns index after the string literal starting at start
+    quote = text[start]
+    i = start + 1
+    while i < len(text):
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text[i] == quote:
+            return i + 1
+        if text[i] == "\n" and quote != "`":
+            # Unterminated string. Stop at end of line.
+            return i
+        i += 1
+    return len(text)
+
+
+def _skip_regex(text, start):
+    # Returns index after the regular expression literal starting at start
+    i = start + 1
+    in_class = False
+    while i < len(text):
+        char = text[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "\n":
+            return i
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            return i + 1
+        i += 1
+    return len(text)
+
+
+# Characters and keywords after which a slash starts a regular expression
+_JS_REGEX_PREFIX = set("(,=:[!&|?{};+-*%<>~^")
+_JS_REGEX_KEYWORDS = ("return", "typeof", "case", "do", "else", "in",
+                      "instanceof", "new", "delete", "void", "throw")
+_JS_REGEX_KEYWORD = re.compile(r"(?:^|[^\w$])(?:%s)$"
+                               % "|".join(_JS_REGEX_KEYWORDS))
+
+
+def _js_regex_allowed(parts):
+    # Decides from the output so far whether a slash starts a regex
+    code = "".join(parts[-4:]).rstrip()
+    if code == "":
+        return True
+    if code[-1] in _JS_REGEX_PREFIX:
+        return True
+    return _JS_REGEX_KEYWORD.search(code) is not None
+
+
+def minify_js(text):
+    '''Removes comments, indentation and empty lines from JavaScript.
+       Line breaks are kept, so automatic semicolon insertion still
+       works as before. Strings, template literals and regular
+       expressions are kept as they are.'''
+
+    parts = []
+    literals = set()  # Indices of parts that are kept as they are
+    i = 0
+    start = 0
+    while i < len(text):
+        char = text[i]
+        if char in "\"'`":
+            parts.append(text[start:i])
+            start = i
+            i = _skip_string(text, i)
+            literals.add(len(parts))
+            parts.append(text[start:i])
+            start = i
+        elif text.startswith("//", i):
+            parts.append(text[start:i])
+            i = text.find("\n", i)
+            if i == -1:
+                i = len(text)
+            start = i
+        elif text.startswith("/*", i):
+            parts.append(text[start:i])
+            end = text.find("*/", i + 2)
+            i = len(text) if end == -1 else end + 2
+            # Keep a separator so tokens are not joined
+            parts.append("\n" if "\n" in text[start:i] else " ")
+            start = i
+        elif char == "/":
+            parts.append(text[start:i])
+            start = i
+            if _js_regex_allowed(parts):
+                i = _skip_regex(text, i)
+                literals.add(len(parts))
+                parts.append(text[start:i])
+                start = i
+            else:
+                i += 1
+        else:
+            i += 1
+    parts.append(text[start:])
+
+    # Whitespace is only removed from the code between literals
+    output = []
+    code = []
+    for index, part in enumerate(parts):
+        if index in literals:
+            output.append(_minify_js_code("".join(code)))
+            output.append(part)
+            code = []
+        else:
+            code.append(part)
+    output.append(_minify_js_code("".join(code)))
+
+    # Output starts and ends with code
+    output[0] = output[0].lstrip()
+    output[-1] = output[-1].rstrip()
+    return "".join(output)
+
+
+def _minify_js_code(code):
+    # Remove indentation, trailing whitespace and empty lines
+    return re.sub(r"[ \t]*\n\s*", "\n", code)
+
+
+def minify_css(text):
+    '''Removes comments and unnecessary whitespace from CSS.'''
+
+    parts = []
+    code = []
+    i = 0
+    start = 0
+    while i < len(text):
+        char = text[i]
+        if char in "\"'":
+            # Keep strings as they are
+            code.append(text[start:i])
+            parts.append(_minify_css_code("".join(code)))
+            code = []
+            start = i
+            i = _skip_string(text, i)
+            parts.append(text[start:i])
+            start = i
+        elif text.startswith("/*", i):
+            code.append(text[start:i] + " ")
+            end = text.find("*/", i + 2)
+            i = len(text) if end == -1 else end + 2
+            start = i
+        else:
+            i += 1
+    code.append(text[start:])
+    parts.append(_minify_css_code("".join(code)))
+
+    return "".join(parts).strip()
+
+
+def _minify_css_code(code):
+    # Collapse whitespace and remove it around characters where it has no
+    # meaning. Whitespace before ':' is kept (e.g. "a :hover").
+    code = re.sub(r"\s+", " ", code)
+    code = re.sub(r" ?([{};,>]) ?", r"\1", code)
+    code = re.sub(r": ", ":", code)
+    return code.replace(";}", "}")
+
+
+def minify_json(text):
+    '''Removes all whitespace from JSON. Invalid JSON is left untouched.'''
+
+    try:
+        return json.dumps(json.loads(text), separators=(",", ":"),
+                          ensure_ascii=False)
+    except ValueError:
+        return text
+
+
+# Elements whose content is kept, or handed to another minifier
+_HTML_RAW = re.compile(r"(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2\s*>)",
+                       re.IGNORECASE | re.DOTALL)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+_HTML_TAG = re.compile(r"<[a-zA-Z/!][^>\"']*(?:(?:\"[^\"]*\"|'[^']*')[^>\"']*)*>")
+_HTML_QUOTED = re.compile(r"(\"[^\"]*\"|'[^']*')")
+_HTML_SPACE = re.compile(r"\s+")
+
+
+def minify_html(text):
+    '''Removes comments and collapses whitespace in HTML. Content of pre
+       and textarea elements is kept, inline scripts and styles are
+       minified as JavaScript and CSS.'''
+
+    parts = []
+    position = 0
+    for match in _HTML_RAW.finditer(text):
+        parts.append(_minify_html_markup(text[position:match.start()]))
+
+        tag = match.group(2).lower()
+        content = match.group(3)
+        if tag == "script" and "type=" not in match.group(1).lower():
+            content = minify_js(content)
+        elif tag == "style":
+            content = minify_css(content)
+
+        parts.append(_minify_html_markup(match.group(1)) + content + match.group(4))
+        position = match.end()
+    parts.append(_minify_html_markup(text[position:]))
+
+    return "".join(parts).strip()
+
+
+def _minify_html_markup(markup):
+    # Whitespace is collapsed instead of removed as it may be significant
+    # between inline elements
+    markup = _HTML_COMMENT.sub("", markup)
+
+    # Quoted attribute values are kept as they are
+    parts = []
+    position = 0
+    for match in _HTML_TAG.finditer(markup):
+        parts.append(_HTML_SPACE.sub(" ", markup[position:match.start()]))
+        parts.extend(piece if index % 2 else _HTML_SPACE.sub(" ", piece)
+                     for index, piece in enumerate(_HTML_QUOTED.split(match.group())))
+        position = match.end()
+    parts.append(_HTML_SPACE.sub(" ", markup[position:]))
+    return "".join(parts)
+
+
+# Minifier for each MIME type
+MINIFIERS = {
+    "text/html": minify_html,
+    "text/css": minify_css,
+    "text/javascript": minify_js,
+    "application/javascript": minify_js,
+    "application/json": minify_json,
+}
+
+
+def minify(mime, text):
+    '''Returns minified text using the minifier registered for the MIME
+       type. Text of other types is returned unchanged.'''
+
+    minifier = MINIFIERS.get(mime)
+    if minifier is None:
+        return text
+    return minifier(text)
@@ -0,0 +1,124 @@
+import datetime
+import cProfile
+import json
+import time
+import os
+
+from contextlib import contextmanager
+from .__init__ import __version__
+
+
+class Stopwatch():
+    """Measures consecutive steps of a task. Every call to lap stores the
+       time since the previous lap (or creation) under the given name.
+       The first lap can be measured from an earlier start time
+       (time.perf_counter)."""
+
+    def __init__(self, start=None):
+        self.laps = {}
+        self.last = time.perf_counter() if start is None else start
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.laps[name] = self.laps.get(name, 0.0) + now - self.last
+        self.last = now
+
+    def total(self):
+        return sum(self.laps.values())
+
+
+class BuildProfiler():
+    """Collects timings of build phases, input files and template files.
+       The result can be written as JSON report, optionally along with a
+       cProfile capture of the whole build."""
+
+    def __init__(self, command, capture=False):
+        self.command = command
+        self.started = datetime.datetime.now()
+        self.phases = []
+        self.files = []
+        self.templates = []
+        self.profile = cProfile.Profile() if capture else None
+
+    @contextmanager
+    def phase(self, name):
+        '''Context manager timing a build phase.'''
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"name": name,
+                                "seconds": time.perf_counter() - start})
+
+    @contextmanager
+    def capture(self):
+        '''Context manager running cProfile if capturing is enabled.'''
+
+        if self.profile is None:
+            yield
+            return
+
+        self.profile.enable()
+        try:
+            yield
+        finally:
+            self.profile.disable()
+
+    def add_file(self, file_name, laps, bytes_in, bytes_out, cached=False):
+        self.files.append({"name": file_name,
+                           "seconds": sum(laps.values()),
+                           "steps": laps,
+                           "bytes_in": bytes_in,
+                           "bytes_out": bytes_out,
+                           "cached": cached})
+
+    def add_template(self, file_name, laps, bytes_out):
+        self.templates.append({"name": file_name,
+                               "seconds": sum(laps.values()),
+                               "steps": laps,
+                               "bytes_out": bytes_out})
+
+    def report(self):
+        '''Returns collected data as dict.'''
+
+        return {
+            "version": __version__,
+            "command": self.command,
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": sum(phase["seconds"] for phase in self.phases),
+            "phases": self.phases,
+            "files": sorted(self.files, key=lambda file: file["name"]),
+            "templates": sorted(self.templates, key=lambda file: file["name"]),
+        }
+
+    def write(self, folder):
+        '''Writes JSON report (and cProfile stats) to folder.
+           Returns path of the JSON report.'''
+
+        os.makedirs(folder, exist_ok=True)
+        name = "%s-%s" % (self.command, self.started.strftime("%Y%m%d-%H%M%S"))
+
+        report_path = os.path.join(folder, name + ".json")
+        with open(report_path, "w") as file:
+            json.dump(self.report(), file, indent=1)
+
+        if self.profile is not None:
+            self.profile.dump_stats(os.path.join(folder, name + ".prof"))
+
+        return report_path
+
+    def print_summary(self, userio):
+        '''Prints phase timings and slowest files.'''
+
+        userio.quick_table("Build phases", ["Phase", "Seconds"],
+                           [[phase["name"], "%.3f" % phase["seconds"]]
+                            for phase in self.phases])
+
+        slowest = sorted(self.files, key=lambda file: file["seconds"],
+                         reverse=True)[:10]
+        userio.quick_table("Slowest files",
+                           ["File", "Seconds", "Bytes in", "Bytes out", "Cached"],
+                           [[file["name"], "%.3f" % file["seconds"],
+                             file["bytes_in"], file["bytes_out"], file["cached"]]
+                            for file in slowest], verbose=True)
@@ -1,18 +1,36 @@
 import configparser
 import shutil
+import time
 import io
 import os
+import re
 
-from .helper import get_files_rec
-from .generator import get_template_path, get_demo_path, generate
-from .arduino import sketch_compile, sketch_upload, get_board, get_board_connected
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .helper import get_files_rec, get_object_files, is_inside
+from .generator import get_template_path, get_demo_path, generate, get_input_data
+from .arduino import sketch_compile, sketch_upload, get_board, get_board_connected, \
+    get_board_catalog, get_boards_connected, get_board_properties
+from .footprint import get_asset_footprint, parse_size_output, parse_board_limits
+from .manifest import Manifest
 from .userio import get_ssid_pass
+from .profiler import BuildProfiler, Stopwatch
+from .watcher import create_watcher, wait_for_changes
 
 
 class Project():
     userio = None
     root_path = ""
 
+    # Default build folders relative to the project root. Used for
+    # projects whose config has no BUILD section.
+    default_build_path = os.path.join(".wgen", "build")
+    default_build_cache_path = os.path.join(".wgen", "build-cache")
+
+    # File put into build folders created by wgen. 'wgen clean' only
+    # deletes folders outside of .wgen without asking if they have it.
+    build_marker = ".wgen-build"
+
     @staticmethod
     def make_config(input_path, template_path, output_path,
                     mode, ssid, port) -> str:
@@ -32,6 +50,11 @@ class Project():
                 "ssid": ssid,
                 "port": port,
             }
+        config["BUILD"] = \
+            {
+                "build_path": Project.default_build_path,
+                "build_cache_path": Project.default_build_cache_path,
+            }
 
         # Write to buffer and return content
         with io.StringIO() as buffer:
@@ -69,10 +92,10 @@ class Project():
             userio.warn("Data will %sbe deleted by this action!"
                         % ("" if delete_block else "not "))
 
-            userio.print("Press Enter to continue anyway. Ctrl+C to cancel!")
-            try:
-                input()
-            except KeyboardInterrupt:
+            action = None
+            if delete_block:
+                action = "delete existing project files in " + os.path.abspath(project_path)
+            if not userio.confirm("Press Enter to continue anyway. Ctrl+C to cancel!", action):
                 return
 
         # Open project and do not check if its a valid one
@@ -199,6 +222,22 @@ class Project():
 
         return input_path, output_path, template_path
 
+    def read_config_build(self):
+        '''Returns build_path, build_cache_path of current project.
+           arduino-cli keeps compiled objects in build_path (one folder
+           per board) and compiled cores in build_cache_path.'''
+        config = configparser.ConfigParser()
+        config.read(self.get_config_file_path())
+
+        build = config["BUILD"] if "BUILD" in config.sections() else {}
+        build_path = os.path.join(self.root_path,
+                                  build.get("build_path", self.default_build_path))
+        build_cache_path = os.path.join(self.root_path,
+                                        build.get("build_cache_path",
+                                                  self.default_build_cache_path))
+
+        return build_path, build_cache_path
+
     def read_config_meta(self):
         config = configparser.ConfigParser()
         config.read(self.get_config_file_path())
@@ -231,10 +270,39 @@ class Project():
         with open(self.get_config_file_path(), "w") as file:
             config.write(file)
 
-    def generate(self, quiet):
+    def get_build_folder_path(self, fqbn):
+        '''Returns path of the arduino-cli build folder for a board.'''
+
+        build_path, build_cache_path = self.read_config_build()
+        return os.path.join(build_path, re.sub(r"[^\w.-]", "_", fqbn))
+
+    def create_build_folders(self):
+        '''Creates missing build folders and marks them as created by
+           wgen. Existing folders are not marked.'''
+
+        for folder in self.read_config_build():
+            if not os.path.isdir(folder):
+                os.makedirs(folder, exist_ok=True)
+                with open(os.path.join(folder, self.build_marker), "w"):
+                    pass
+
+    def get_profile_folder_path(self):
+        '''Returns path to the folder holding profiling reports.'''
+
+        return os.path.join(self.get_config_folder_path(), "profile")
+
+    def write_profile(self, profiler):
+        '''Writes profiling report of the profiler and prints a summary.'''
+
+        self.userio.section("Profiling results")
+        profiler.print_summary(self.userio)
+        report_path = profiler.write(self.get_profile_folder_path())
+        self.userio.print("Profiling report written to " + report_path)
+
+    def get_meta_data(self, quiet):
+        '''Returns meta data of current project including the network
+           credentials. Asks the user for credentials missing in the config.'''
 
-        # Read project data
-        input_path, output_path, template_path = self.read_config_project()
         meta_data = self.read_config_meta()
 
         # Enter ssid is none is in config
@@ -243,13 +311,67 @@ class Project():
 
         # Get password (and ssid if necessary)
         meta_data["ssid"], meta_data["pass"] = get_ssid_pass(self.userio, meta_data["ssid"], quiet)
+        return meta_data
+
+    def get_fqbn(self, force_select=False, save=False, refresh=False):
+        '''Returns FQBN of target board. Asks the user to select one if
+           none is saved in the project.'''
+
+        fqbn = self.read_config_fqbn()
+        if force_select or fqbn is None:
+            if not self.userio.interactive:
+                self.userio.error("No target board saved in the project. Pass --fqbn or "
+                                  "select and save one with 'wgen compile --save'.")
+            name, fqbn = get_board(self.userio, refresh)
+        else:
+            self.check_boards([fqbn], refresh)
+        if save:
+            self.write_config_fqbn(fqbn)
+        return fqbn
+
+    def check_boards(self, fqbns, refresh=False):
+        '''Warns about boards that are not known to arduino-cli. Only
+           uses the cached board catalog (unless refresh is True), so
+           boards are not checked if there is none.'''
+
+        catalog = get_board_catalog(self.userio, refresh, cached_only=True)
+        if catalog is None:
+            return
+        for fqbn in fqbns:
+            if catalog.find(fqbn) is None:
+                self.userio.warn("Board %s is not known to arduino-cli. "
+                                 "Is its core installed?" % fqbn)
 
-        # Eventually create output
-        generate(self.userio, input_path, output_path, template_path, meta_data)
+    def generate(self, quiet, jobs=1, compress=False, minify=False,
+                 profile=False, capture=False, meta_data=None, split=False):
 
-    def compile(self, force_select=False, save=False):
+        # Read project data
+        input_path, output_path, template_path = self.read_config_project()
+        if meta_data is None:
+            meta_data = self.get_meta_data(quiet)
+
+        # Eventually create output. Reuses data of the previous build.
+        profiler = BuildProfiler("build", capture)
+        with profiler.capture():
+            generate(self.userio, input_path, output_path, template_path, meta_data,
+                     cache_path=self.get_config_folder_path(), jobs=jobs,
+                     compress=compress, minify=minify, profiler=profiler,
+                     split=split)
+
+        if profile or capture:
+            self.write_profile(profiler)
+
+    def compile(self, force_select=False, save=False, profile=False, fqbn=None,
+                refresh_boards=False, fqbns=None, jobs=1):
         self.userio.section("Compiling project output")
 
+        # Batch compile for multiple boards
+        if fqbns:
+            compiled = self.compile_boards(fqbns, jobs)
+            if len(compiled) != len(fqbns):
+                self.userio.error("Compiled for %d of %d boards." % (len(compiled), len(fqbns)))
+            return
+
         # Get project output location
         sketch_path = self.get_sketch_path()
         if sketch_path is None:
@@ -257,14 +379,350 @@ class Project():
         self.userio.print("Sketch located: " + sketch_path, verbose=True)
 
         # Get target FQBN
-        fqbn = self.read_config_fqbn()
-        if force_select or fqbn is None:
-            name, fqbn = get_board(self.userio)
-        if save:
-            self.write_config_fqbn(fqbn)
+        if fqbn is None:
+            fqbn = self.get_fqbn(force_select, save, refresh_boards)
 
         # Compile sketch using arduino-cli
-        sketch_compile(self.userio, sketch_path, fqbn)
+        profiler = BuildProfiler("compile")
+        with profiler.phase("arduino-cli compile"):
+            success, output, objects = self.compile_board(sketch_path, fqbn)
+
+        if success:
+            self.print_object_report(fqbn, objects)
+        else:
+            self.userio.warn("Compilation failed!")
+        if profile:
+            self.write_profile(profiler)
+
+    def size(self, jobs=1, compress=False, minify=False, fqbn=None, compile=False):
+        '''Reports flash used by each asset and the projected total
+           against the limits of the target board. Optionally compiles
+           the sketch and reports the actual usage.'''
+
+        input_path, output_path, template_path = self.read_config_project()
+
+        # Process input as a build would. Unchanged files come from the
+        # cache of the last build, which is left as it is.
+        self.userio.section("Processing input files...")
+        manifest = Manifest(self.get_config_folder_path(),
+                            {"compress": compress, "minify": minify}, read_only=True)
+        file_data, mime_data = get_input_data(self.userio, input_path, manifest,
+                                              jobs, compress, minify)
+
+        self.userio.section("Asset footprint")
+        assets = get_asset_footprint(file_data)
+        self.userio.quick_table("Assets (largest first)",
+                                ["File name", "Type", "Raw size", "Minified size",
+                                 "Source size", "PROGMEM"],
+                                [[asset["name"], asset["type"], asset["raw_size"],
+                                  asset["minified_size"], asset["source_size"],
+                                  asset["progmem_size"]]
+                                 for asset in assets])
+        total = sum(asset["progmem_size"] for asset in assets)
+        self.userio.print("Assets use %d bytes of PROGMEM (%d bytes raw, "
+                          "%d bytes of generated source)"
+                          % (total, sum(asset["raw_size"] for asset in assets),
+                             sum(asset["source_size"] for asset in assets)))
+
+        # Limits of the target board need a generated sketch
+        sketch_path = self.get_sketch_path()
+        if sketch_path is None:
+            self.userio.warn("Build the project to compare against board limits.")
+            return
+        if fqbn is None:
+            fqbn = self.get_fqbn()
+
+        limits = parse_board_limits(get_board_properties(self.userio, sketch_path, fqbn))
+        if "flash" in limits:
+            self.userio.print("Assets use %.1f%% of %d bytes flash of %s"
+                              % (100.0 * total / limits["flash"], limits["flash"], fqbn))
+            if total > limits["flash"]:
+                self.userio.warn("Assets alone exceed the flash of %s!" % fqbn)
+        else:
+            self.userio.warn("Could not get flash size of " + fqbn)
+
+        if not compile:
+            return
+
+        self.userio.section("Compiling project output")
+        success, output, objects = self.compile_board(sketch_path, fqbn, capture=True)
+        if not success:
+            self.userio.print(output.rstrip())
+            self.userio.error("Compilation failed!")
+
+        usage = parse_size_output(output)
+        self.userio.quick_table("Memory usage of " + fqbn,
+                                ["Memory", "Used", "Maximum", "Used %"],
+                                [[name, used, maximum,
+                                  "%.1f" % (100.0 * used / maximum) if maximum else "-"]
+                                 for name, (used, maximum) in usage.items()])
+        if "flash" in usage and usage["flash"][0]:
+            self.userio.print("Assets are %.1f%% of the used flash"
+                              % (100.0 * total / usage["flash"][0]))
+
+    def serve(self, host="127.0.0.1", port=8080, jobs=1, compress=False,
+              minify=False, bandwidth=None, chunk_size=None):
+        '''Serves the input files on the host as the generated sketch
+           would. Runs until interrupted by the user.'''
+
+        from .simulator import Simulator, get_chunk_size
+        if chunk_size is None:
+            chunk_size = get_chunk_size(self.read_config_fqbn())
+
+        input_path, output_path, template_path = self.read_config_project()
+
+        # Process input as a build would. Unchanged files come from the
+        # cache of the last build, which is left as it is.
+        self.userio.section("Processing input files...")
+        manifest = Manifest(self.get_config_folder_path(),
+                            {"compress": compress, "minify": minify}, read_only=True)
+        file_data, mime_data = get_input_data(self.userio, input_path, manifest,
+                                              jobs, compress, minify)
+
+        simulator = Simulator(self.userio, file_data, bandwidth, chunk_size)
+        self.userio.quick_table("Routes", ["Path", "Type", "MIME type", "Size"],
+                                simulator.get_status, verbose=True)
+        for file_name, data in file_data.items():
+            if data["file_type"] == 2:
+                self.userio.warn("Dynamic page %s only runs on the board. "
+                                 "The simulator responds with 501." % file_name)
+        if simulator.default is None:
+            self.userio.warn("No index.html. Requests of / fail as on the board.")
+
+        self.userio.section("Serving on http://%s:%d/. Press Ctrl+C to stop."
+                            % (host, port))
+        if bandwidth is not None:
+            self.userio.print("Sending %d bytes per second in chunks of %d bytes"
+                              % (bandwidth, chunk_size))
+        simulator.run(host, port)
+
+    def watch(self, quiet, jobs=1, compress=False, minify=False,
+              compile=False, debounce=0.2, polling=False, split=False):
+        '''Rebuilds (and compiles) the project whenever input or template
+           files change. Runs until interrupted by the user.'''
+
+        input_path, output_path, template_path = self.read_config_project()
+
+        # Ask for everything interactive once, before watching
+        meta_data = self.get_meta_data(quiet)
+        fqbn = self.get_fqbn() if compile else None
+
+        def build(watch):
+            self.generate(quiet, jobs, compress, minify, meta_data=meta_data,
+                          split=split)
+            watch.lap("build")
+            if compile:
+                self.compile(fqbn=fqbn)
+                watch.lap("compile")
+
+        def try_build(watch):
+            # Keep watching if the build fails. The next change might fix
+            # the error. userio.error exits, so SystemExit is caught too.
+            try:
+                build(watch)
+                return True
+            except SystemExit:
+                self.userio.warn("Build failed.")
+            except Exception as exception:
+                self.userio.warn("Build failed: %s" % exception)
+            return False
+
+        # Changes made during the initial build trigger another cycle
+        watcher = create_watcher([input_path, template_path], polling)
+        try:
+            try_build(Stopwatch())
+            self.userio.section("Watching for changes (%s). Press Ctrl+C to stop."
+                                % watcher.name)
+            while True:
+                changes, first_change = wait_for_changes(watcher, debounce)
+
+                # Latency is measured from the first detected change
+                watch = Stopwatch(first_change)
+                watch.lap("debounce")
+
+                self.userio.section("%d changed files detected" % len(changes))
+                self.userio.quick_table("", ["Changed Files"],
+                                        lambda: [[path] for path in sorted(changes)],
+                                        verbose=True)
+
+                if not try_build(watch):
+                    continue
+
+                self.userio.print("Cycle finished in %.3fs (%s)"
+                                  % (watch.total(),
+                                     ", ".join("%s %.3fs" % lap
+                                               for lap in watch.laps.items())))
+        except KeyboardInterrupt:
+            self.userio.print("Stopped watching.")
+        finally:
+            watcher.close()
+
+    def compile_board(self, sketch_path, fqbn, capture=False):
+        '''Compiles sketch for a board in the persistent build folders.
+           Returns success, output (if captured) and the number of
+           reused and compiled objects of the board's build folder.'''
+
+        build_path = self.get_build_folder_path(fqbn)
+        _, build_cache_path = self.read_config_build()
+
+        self.create_build_folders()
+
+        # Only the board's own folder is counted. The core cache is shared
+        # with boards compiled at the same time.
+        before = get_object_files([build_path])
+        success, output = sketch_compile(self.userio, sketch_path, fqbn, build_path,
+                                         capture, build_cache_path)
+        after = get_object_files([build_path])
+
+        # Objects that were not written again came from the cache
+        reused = sum(1 for path, mtime in after.items() if before.get(path) == mtime)
+        return success, output, (reused, len(after) - reused)
+
+    def print_object_report(self, target, objects):
+        reused, compiled = objects
+        self.userio.print("%s: reused %d of %d objects, compiled %d"
+                          % (target, reused, reused + compiled, compiled))
+
+    def clean(self, clean_all=False):
+        '''Deletes build folders of the project. Also deletes the
+           generator cache if clean_all is True.'''
+
+        self.userio.section("Cleaning project")
+
+        folders = list(self.read_config_build())
+        if clean_all:
+            config_path = self.get_config_folder_path()
+            folders += [os.path.join(config_path, "payloads"),
+                        os.path.join(config_path, "jinja"),
+                        os.path.join(config_path, "manifest.json"),
+                        os.path.join(config_path, "symbols.json")]
+
+        for folder in folders:
+            if not os.path.exists(folder) or not self.check_clean(folder):
+                continue
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+            else:
+                os.remove(folder)
+            self.userio.print("Deleted " + folder)
+
+    def check_clean(self, path):
+        '''Returns whether clean may delete path. The project and the
+           folders containing it are never deleted. Other paths are
+           deleted without asking if they are inside of .wgen or were
+           created by wgen.'''
+
+        if is_inside(self.root_path, path):
+            self.userio.warn("Not deleting %s. It contains the project!"
+                             % os.path.abspath(path))
+            return False
+
+        config_path = self.get_config_folder_path()
+        if is_inside(path, config_path) and not is_inside(config_path, path):
+            return True
+        if os.path.isfile(os.path.join(path, self.build_marker)):
+            return True
+
+        path = os.path.abspath(path)
+        self.userio.warn("%s was not created by wgen!" % path)
+        return self.userio.confirm("Press Enter to delete it anyway. Ctrl+C to skip!",
+                                   "delete " + path)
+
+    def run_batch(self, title, tasks, jobs):
+        '''Runs tasks (device, fqbn, function returning success and
+           output) on up to jobs threads and prints a summary.
+           Returns set of devices whose task succeeded.'''
+
+        def run(function):
+            start = time.perf_counter()
+            success, output = function()
+            return success, output, time.perf_counter() - start
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(run, function): (device, fqbn)
+                       for device, fqbn, function in tasks}
+            for future in as_completed(futures):
+                device, fqbn = futures[future]
+                success, output, seconds = future.result()
+                results[device] = (fqbn, success, seconds)
+
+                # Print output of each task as a whole, as tasks run at the
+                # same time. Output of successful tasks is verbose only.
+                if not success:
+                    self.userio.warn("%s failed for %s" % (title, device))
+                if output and (not success or self.userio.verbose):
+                    self.userio.print(output.rstrip())
+
+        self.userio.quick_table(title + " summary", ["Target", "FQBN", "Result", "Seconds"],
+                                [[device, fqbn, "ok" if success else "[red]failed",
+                                  "%.1f" % seconds]
+                                 for device, (fqbn, success, seconds) in sorted(results.items())])
+        return {device for device, (_, success, _) in results.items() if success}
+
+    def compile_boards(self, fqbns, jobs=1):
+        '''Compiles project output for every board in fqbns in parallel.
+           Each board has its own build folder.
+           Returns set of boards compiled successfully.'''
+
+        sketch_path = self.get_sketch_path()
+        if sketch_path is None:
+            self.userio.error("Could not locate output files!")
+
+        self.check_boards(fqbns)
+
+        objects = {}
+
+        def compile_task(fqbn):
+            def task():
+                success, output, objects[fqbn] = self.compile_board(sketch_path, fqbn,
+                                                                    capture=True)
+                return success, output
+            return task
+
+        self.userio.print("Compiling for %d boards using %d jobs"
+                          % (len(fqbns), min(jobs, len(fqbns))))
+        compiled = self.run_batch("Compile",
+                                  [(fqbn, fqbn, compile_task(fqbn)) for fqbn in fqbns],
+                                  jobs)
+
+        for fqbn in sorted(objects):
+            self.print_object_report(fqbn, objects[fqbn])
+        return compiled
+
+    def upload_all(self, jobs=1):
+        '''Compiles project output once per distinct board type and
+           uploads it to all connected boards in parallel.'''
+
+        self.userio.section("Uploading project output to all boards")
+
+        sketch_path = self.get_sketch_path()
+        if sketch_path is None:
+            self.userio.error("Could not locate output files!")
+
+        boards = get_boards_connected(self.userio)
+        if len(boards) == 0:
+            self.userio.error("No boards found!")
+        self.userio.quick_table("Connected boards", ["Address", "Name", "FQBN"],
+                                [[board["address"], board["name"], board["FQBN"]]
+                                 for board in boards])
+
+        compiled = self.compile_boards(sorted({board["FQBN"] for board in boards}), jobs)
+
+        def upload_task(board):
+            return lambda: sketch_upload(self.userio, sketch_path, board["FQBN"],
+                                         board["address"],
+                                         self.get_build_folder_path(board["FQBN"]),
+                                         capture=True)
+
+        uploaded = self.run_batch("Upload",
+                                  [(board["address"], board["FQBN"], upload_task(board))
+                                   for board in boards if board["FQBN"] in compiled],
+                                  jobs)
+
+        if len(uploaded) != len(boards):
+            self.userio.error("Uploaded to %d of %d boards." % (len(uploaded), len(boards)))
+        self.userio.print("Uploaded to all %d boards." % len(boards))
 
     def upload(self):
         self.userio.section("Uploading project output")
@@ -278,5 +736,9 @@ class Project():
         # Get target FQBN
         name, fqbn, address = get_board_connected(self.userio)
 
-        # Compile sketch using arduino-cli
-        sketch_upload(self.userio, sketch_path, fqbn, address)
+        # Upload sketch using arduino-cli. Uses the compiled sketch of the
+        # build folder if there is one.
+        build_path = self.get_build_folder_path(fqbn)
+        if not os.path.isdir(build_path):
+            build_path = None
+        sketch_upload(self.userio, sketch_path, fqbn, address, build_path)
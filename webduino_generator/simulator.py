@@ -0,0 +1,301 @@
+import asyncio
+import time
+import re
+
+from .footprint import FILE_TYPES
+
+
+# Constants of WebServer.h and main.ino the responses are built from
+CRLF = b"\r\n"
+SERVER_HEADER = b"Server: Webduino/1.7" + CRLF
+CACHE_CONTROL = b"no-cache"
+FAIL_MESSAGE = b"<h1>400 Bad Request</h1>"
+NOT_ACCEPTABLE_MESSAGE = b"<h1>406 Not Acceptable</h1>"
+
+# Request methods known to WebServer
+METHODS = (b"GET", b"HEAD", b"POST", b"PUT", b"DELETE", b"PATCH")
+
+# Buffer sizes of WebServer. The request buffer holds the URL including
+# the terminating zero. Header buffers hold two characters less than
+# their size (see WebServer::readHeader).
+REQUEST_LENGTH = 32
+ETAG_LENGTH = 48
+ACCEPT_ENCODING_LENGTH = 64
+
+# Size of the socket writes of WebServer. AVR boards send everything
+# through the 32 byte output buffer. Other boards send data from PROGMEM
+# (most of a response) in writes of WEBDUINO_WRITE_CHUNK_SIZE.
+AVR_CHUNK_SIZE = 32
+DEFAULT_CHUNK_SIZE = 1024
+AVR_ARCHITECTURES = ("avr", "megaavr")
+
+# Seconds a client may take to send the request headers
+REQUEST_TIMEOUT = 10
+
+_OCTAL_ESCAPE = re.compile(rb"\\([0-7]{3})")
+_HEX_BYTE = re.compile(r"0x([0-9a-f]{1,2})")
+_ZERO_QUALITY = re.compile(rb"0(?:\.0*)?(?![0-9.])")
+
+
+def cpp_str_unesc(text):
+    '''Returns bytes of a string escaped by cpp_str_esc.'''
+
+    return _OCTAL_ESCAPE.sub(lambda match: bytes([int(match.group(1), 8)]),
+                             text.encode("ascii"))
+
+
+def cpp_array_unesc(text):
+    '''Returns bytes of a C array initializer created by cpp_img_esc.'''
+
+    return bytes(int(byte, 16) for byte in _HEX_BYTE.findall(text))
+
+
+def get_chunk_size(fqbn):
+    '''Returns size of the socket writes of the sketch on a board.
+       Boards that are not known (fqbn is None) are not AVR based, as
+       most WiFiNINA boards.'''
+
+    parts = (fqbn or "").split(":")
+    if len(parts) > 1 and parts[1] in AVR_ARCHITECTURES:
+        return AVR_CHUNK_SIZE
+    return DEFAULT_CHUNK_SIZE
+
+
+def encoding_accepted(header, coding):
+    '''Returns whether the value of an Accept-Encoding header allows
+       the coding (encodingAccepted of WebServer.h). Codings with q=0
+       are not allowed, "*" stands for all codings not listed.'''
+
+    wildcard = False
+    for entry in header.split(b","):
+        name, *parameters = entry.split(b";")
+        name = name.strip(b" \t").lower()
+        allowed = True
+        for parameter in parameters:
+            key, _, value = parameter.strip(b" \t").partition(b"=")
+            if key.lower() == b"q":
+                allowed = _ZERO_QUALITY.match(value) is None
+        if name == coding:
+            return allowed
+        if name == b"*":
+            wildcard = allowed
+    return wildcard
+
+
+class Route():
+    """Page of the generated sketch, restored from its fileData entry.
+       The body is the data the sketch stores in PROGMEM."""
+
+    def __init__(self, data):
+        self.file_type = data["file_type"]
+        self.mime = cpp_str_unesc(data["mime"])
+        self.etag = b'"' + data["file_etag"].encode("ascii") + b'"'
+
+        self.headers = b"ETag: " + self.etag + CRLF + \
+            b"Cache-Control: " + CACHE_CONTROL + CRLF
+        if self.file_type == 3:
+            self.headers += b"Content-Encoding: gzip" + CRLF + \
+                b"Vary: Accept-Encoding" + CRLF
+
+        self.body = b""
+        if self.file_type == 0:
+            self.body = cpp_str_unesc(str(data["file_content"]))
+        elif self.file_type in (1, 3):
+            self.body = cpp_array_unesc(str(data["file_content"]))
+
+
+class Request():
+    # Request as seen by WebServer::processConnection
+    def __init__(self):
+        self.method = None
+        self.url = b""
+        self.accept_gzip = True  # No Accept-Encoding header
+        self.if_none_match = b""
+
+
+def _success(mime, headers=None, length=None):
+    # WebServer::httpSuccess
+    response = b"HTTP/1.0 200 OK" + CRLF + SERVER_HEADER + \
+        b"Access-Control-Allow-Origin: *" + CRLF + \
+        b"Content-Type: " + mime + CRLF
+    if length is not None:
+        response += b"Content-Length: %d" % length + CRLF
+    if headers:
+        response += headers
+    return response + CRLF
+
+
+def _fail():
+    # WebServer::httpFail
+    return b"HTTP/1.0 400 Bad Request" + CRLF + SERVER_HEADER + \
+        b"Content-Type: text/html" + CRLF + CRLF + FAIL_MESSAGE
+
+
+def _not_acceptable():
+    # WebServer::httpNotAcceptable
+    return b"HTTP/1.0 406 Not Acceptable" + CRLF + SERVER_HEADER + \
+        b"Content-Type: text/html" + CRLF + CRLF + NOT_ACCEPTABLE_MESSAGE
+
+
+def _not_modified(headers):
+    # WebServer::httpNotModified
+    return b"HTTP/1.0 304 Not Modified" + CRLF + SERVER_HEADER + headers + CRLF
+
+
+def _not_implemented(name):
+    # Dynamic pages are C++ code and can not be run by the simulator
+    message = b"<h1>501 Not Implemented</h1>Dynamic page " + name + \
+        b" only runs on the board."
+    return b"HTTP/1.0 501 Not Implemented" + CRLF + SERVER_HEADER + \
+        b"Content-Type: text/html" + CRLF + CRLF + message
+
+
+class Simulator():
+    """Serves the pages of fileData the way the generated sketch does.
+       Routes, default page, status codes and headers follow WebServer.h,
+       including its limits (e.g. URLs are cut to the request buffer).
+       Like the board, one connection is handled at a time. Optionally
+       the output is sent in chunks at a limited rate to emulate the
+       bandwidth of the WiFi module."""
+
+    def __init__(self, userio, file_data, bandwidth=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        self.userio = userio
+        self.bandwidth = bandwidth
+        self.chunk_size = chunk_size
+        self.lock = None
+
+        self.routes = {cpp_str_unesc(file_name): Route(data)
+                       for file_name, data in file_data.items()}
+        self.default = self.routes.get(b"index.html")
+
+    def get_status(self):
+        '''Returns table rows describing all routes.'''
+
+        rows = []
+        for name, route in sorted(self.routes.items()):
+            rows.append(["/" + name.decode("UTF-8", "replace"),
+                         FILE_TYPES.get(route.file_type, str(route.file_type)),
+                         route.mime.decode("UTF-8", "replace"),
+                         len(route.body)])
+        return rows
+
+    async def read_request(self, reader):
+        # WebServer::getRequest and WebServer::processHeaders
+        request = Request()
+        line = await reader.readline()
+        method, _, rest = line.partition(b" ")
+        if method not in METHODS or not rest:
+            return request
+        request.method = method
+        request.url = re.split(rb"[ \r\n]", rest, 1)[0][:REQUEST_LENGTH - 1]
+
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return request
+            value = line.partition(b":")[2].strip(b" \t\r\n")
+            if line.startswith(b"Accept-Encoding:"):
+                request.accept_gzip = encoding_accepted(value[:ACCEPT_ENCODING_LENGTH - 2],
+                                                        b"gzip")
+            elif line.startswith(b"If-None-Match:"):
+                request.if_none_match = value[:ETAG_LENGTH - 2]
+
+    def respond_route(self, request, route, name):
+        # Responders of assets.h
+        if route.file_type == 2:
+            return _not_implemented(name)
+
+        if route.file_type == 3 and not request.accept_gzip:
+            return _not_acceptable()
+
+        # WebServer::checkETag
+        if request.if_none_match == b"*" or \
+           (request.if_none_match and route.etag in request.if_none_match):
+            return _not_modified(route.headers)
+
+        response = _success(route.mime, route.headers, len(route.body))
+        if request.method != b"HEAD":
+            response += route.body
+        return response
+
+    def respond(self, request):
+        '''Returns response of the sketch to request.'''
+
+        if request.method is None:
+            return _fail()
+
+        # WebServer::noRobots. The request is still dispatched afterwards.
+        response = b""
+        url = request.url
+        if url == b"/robots.txt":
+            response += _success(b"text/plain")
+            if request.method != b"HEAD":
+                response += b"User-agent: *" + CRLF + b"Disallow: /" + CRLF
+
+        # WebServer::dispatchCommand
+        if url in (b"", b"/") or url.startswith(b"/?"):
+            if self.default is None:
+                return response + _fail()
+            return response + self.respond_route(request, self.default, b"index.html")
+        if url.startswith(b"/"):
+            name = url[1:].partition(b"?")[0]
+            route = self.routes.get(name)
+            if route is not None:
+                return response + self.respond_route(request, route, name)
+        return response + _fail()
+
+    async def send(self, writer, response):
+        # Sends response, limited to the bandwidth if one is set
+        if self.bandwidth is None:
+            writer.write(response)
+            await writer.drain()
+            return
+
+        for offset in range(0, len(response), self.chunk_size):
+            chunk = response[offset:offset + self.chunk_size]
+            writer.write(chunk)
+            await writer.drain()
+            await asyncio.sleep(len(chunk) / self.bandwidth)
+
+    async def handle(self, reader, writer):
+        # Connections are processed one by one, as by the sketch's loop
+        async with self.lock:
+            start = time.perf_counter()
+            try:
+                request = await asyncio.wait_for(self.read_request(reader),
+                                                 REQUEST_TIMEOUT)
+            except (asyncio.TimeoutError, ConnectionError, ValueError):
+                request = Request()
+
+            response = self.respond(request)
+            try:
+                await self.send(writer, response)
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+            status = response[9:12].decode("ascii")
+            self.userio.print("%s %s %s %d bytes %.1f ms"
+                              % ((request.method or b"INVALID").decode("ascii"),
+                                 request.url.decode("UTF-8", "replace"),
+                                 status, len(response),
+                                 1000 * (time.perf_counter() - start)),
+                              verbose=True)
+
+    async def serve(self, host, port):
+        self.lock = asyncio.Lock()
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def run(self, host, port):
+        '''Serves until interrupted by the user.'''
+
+        try:
+            asyncio.run(self.serve(host, port))
+        except OSError as error:
+            self.userio.error("Could not serve on %s:%d: %s" % (host, port, error.strerror))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,92 @@
+import json
+import re
+
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_SYMBOL = re.compile(r"^[0-9a-z]+$")
+
+
+def to_base36(number):
+    '''Returns number as lower case base-36 string.'''
+
+    symbol = ""
+    while True:
+        number, digit = divmod(number, 36)
+        symbol = _DIGITS[digit] + symbol
+        if number == 0:
+            return symbol
+
+
+class SymbolTable():
+    """Assigns short identifiers to names. Identifiers are base-36 numbers
+       handed out in order of first use and are unique by construction.
+       Existing assignments can be passed to keep identifiers stable."""
+
+    def __init__(self, symbols=None):
+        self.symbols = {}
+        self.taken = set()
+        self.used = set()
+        self.next = 0
+
+        # Ignore assignments that are not valid or not unique
+        if symbols:
+            values = list(symbols.values())
+            if len(set(values)) == len(values) and \
+               all(isinstance(value, str) and _SYMBOL.match(value) for value in values):
+                self.symbols = dict(symbols)
+                self.taken = set(values)
+
+    def get(self, name):
+        '''Returns identifier of name. Assigns a new one if needed.'''
+
+        self.used.add(name)
+        symbol = self.symbols.get(name)
+        if symbol is None:
+            symbol = to_base36(self.next)
+            while symbol in self.taken:
+                self.next += 1
+                symbol = to_base36(self.next)
+            self.symbols[name] = symbol
+            self.taken.add(symbol)
+        return symbol
+
+    def export(self):
+        '''Returns assignments of all names used since creation.'''
+
+        return {name: symbol for name, symbol in sorted(self.symbols.items())
+                if name in self.used}
+
+
+class Symbols():
+    """Symbol tables for files and MIME types of a build. If a path is
+       passed, the tables are loaded from and saved to that file, so
+       identifiers stay the same between builds."""
+
+    version = 1
+
+    def __init__(self, path=None):
+        self.path = path
+
+        tables = {}
+        if path is not None:
+            try:
+                with open(path, "r") as file:
+                    tables = json.load(file)
+                if tables.get("version") != self.version:
+                    tables = {}
+            except (OSError, ValueError):
+                tables = {}
+
+        self.files = SymbolTable(tables.get("files"))
+        self.mimes = SymbolTable(tables.get("mimes"))
+
+    def save(self):
+        '''Writes identifiers of all names used in this build.'''
+
+        if self.path is None:
+            return
+
+        with open(self.path, "w") as file:
+            json.dump({"version": self.version,
+                       "files": self.files.export(),
+                       "mimes": self.mimes.export()}, file, indent=1)
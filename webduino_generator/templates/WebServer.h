@@ -71,14 +71,41 @@
 #define WEBDUINO_AUTH_MESSAGE "<h1>401 Unauthorized</h1>"
 #endif // #ifndef WEBDUINO_AUTH_MESSAGE
 
+#ifndef WEBDUINO_NOT_ACCEPTABLE_MESSAGE
+#define WEBDUINO_NOT_ACCEPTABLE_MESSAGE "<h1>406 Not Acceptable</h1>"
+#endif // WEBDUINO_NOT_ACCEPTABLE_MESSAGE
+
 #ifndef WEBDUINO_SERVER_ERROR_MESSAGE
 #define WEBDUINO_SERVER_ERROR_MESSAGE "<h1>500 Internal Server Error</h1>"
 #endif // WEBDUINO_SERVER_ERROR_MESSAGE
 
+// Value of the Cache-Control header sent along with ETags. By default
+// clients have to revalidate using If-None-Match on every request.
+#ifndef WEBDUINO_CACHE_CONTROL
+#define WEBDUINO_CACHE_CONTROL "no-cache"
+#endif // WEBDUINO_CACHE_CONTROL
+
+// Longest If-None-Match header value that is stored
+#ifndef WEBDUINO_ETAG_LENGTH
+#define WEBDUINO_ETAG_LENGTH 48
+#endif // WEBDUINO_ETAG_LENGTH
+
+// Size of the buffer collecting small writes before they are sent.
+// Boards with more RAM default to a larger buffer to save socket writes.
 #ifndef WEBDUINO_OUTPUT_BUFFER_SIZE
+#ifdef __AVR__
 #define WEBDUINO_OUTPUT_BUFFER_SIZE 32
+#else
+#define WEBDUINO_OUTPUT_BUFFER_SIZE 256
+#endif
 #endif // WEBDUINO_OUTPUT_BUFFER_SIZE
 
+// Largest single socket write used by writeP. On AVR the data has to be
+// copied out of program memory, so the output buffer size is used instead.
+#ifndef WEBDUINO_WRITE_CHUNK_SIZE
+#define WEBDUINO_WRITE_CHUNK_SIZE 1024
+#endif // WEBDUINO_WRITE_CHUNK_SIZE
+
 // add "#define WEBDUINO_SERIAL_DEBUGGING 1" to your application
 // before including WebServer.h to have incoming requests logged to
 // the serial port.
@@ -142,6 +169,13 @@ public:
                               char **url_path, char *url_tail,
                               bool tail_complete);
 
+  // entry of a route table passed to setRoutes
+  struct Route
+  {
+    const char *verb;
+    Command *cmd;
+  };
+
   // constructor for webserver object
   WebServer(const char *urlPrefix = "", uint16_t port = 80);
 
@@ -168,6 +202,12 @@ public:
   // add a new command to be run at the URL specified by verb
   void addCommand(const char *verb, Command *cmd);
 
+  // set table of commands to be run at the URLs specified by their verbs.
+  // The table has to be sorted by verb (in strcmp order) as it is searched
+  // using binary search. Unlike addCommand the number of routes is not
+  // limited by WEBDUINO_COMMANDS_COUNT.
+  void setRoutes(const Route *routes, size_t count);
+
   // Set command that's run if default command or URL specified commands do
   // not run, uses extra url_path parameter to allow resolving the URL in the
   // function.
@@ -189,7 +229,8 @@ public:
   void printf(const __FlashStringHelper *format, ... );
   #endif
 
-  // output raw data stored in program memory
+  // output raw data stored in program memory. Data is sent in chunks of
+  // up to WEBDUINO_WRITE_CHUNK_SIZE bytes rather than byte by byte.
   void writeP(const unsigned char *data, size_t length);
 
   // output HTML for a radio button
@@ -254,12 +295,32 @@ public:
   // output headers indicating "204 No Content" and no further message
   void httpNoContent();
 
+  // output headers and a message indicating "406 Not Acceptable"
+  void httpNotAcceptable();
+
+  // returns true if the client accepts gzip compressed responses, i.e.
+  // it sent no Accept-Encoding header or one that allows gzip
+  bool acceptsGzip() { return m_acceptGzip; }
+
+  // returns true if the client sent the (quoted) etag in If-None-Match,
+  // i.e. it already has the current version of the resource
+  bool checkETag(const char *etag);
+
+  // output headers indicating "304 Not Modified" and no further message.
+  // Extra headers (e.g. the ETag) should each be terminated with CRLF.
+  void httpNotModified(const char *extraHeaders = NULL);
+
   // output standard headers indicating "200 Success".  You can change the
   // type of the data you're outputting or also add extra headers like
   // "Refresh: 1".  Extra headers should each be terminated with CRLF.
   void httpSuccess(const char *contentType = "text/html; charset=utf-8",
                    const char *extraHeaders = NULL);
 
+  // same as above, but also outputs a Content-Length header, so the client
+  // does not have to wait for the connection to close
+  void httpSuccess(const char *contentType, const char *extraHeaders,
+                   size_t contentLength);
+
   // used with POST to output a redirect to another URL.  This is
   // preferable to outputting HTML from a post because you can then
   // refresh the page without getting a "resubmit form" dialog.
@@ -287,6 +348,8 @@ private:
 
   int m_contentLength;
   char m_authCredentials[51];
+  bool m_acceptGzip;
+  char m_ifNoneMatch[WEBDUINO_ETAG_LENGTH];
   bool m_readingContent;
 
   Command *m_failureCmd;
@@ -297,15 +360,19 @@ private:
     Command *cmd;
   } m_commands[WEBDUINO_COMMANDS_COUNT];
   unsigned char m_cmdCount;
+  const Route *m_routes;
+  size_t m_routeCount;
   UrlPathCommand *m_urlPathCmd;
 
   uint8_t m_buffer[WEBDUINO_OUTPUT_BUFFER_SIZE];
-  uint8_t m_bufFill;
+  size_t m_bufFill;
 
   void getRequest(WebServer::ConnectionType &type, char *request, int *length);
   bool dispatchCommand(ConnectionType requestType, char *verb,
                        bool tail_complete);
+  const Route *findRoute(const char *verb, size_t verb_len);
   void processHeaders();
+  void printSuccessHeaders(const char *contentType);
   void outputCheckboxOrRadio(const char *element, const char *name,
                              const char *val, const char *label,
                              bool selected);
@@ -330,9 +397,12 @@ WebServer::WebServer(const char *urlPrefix, uint16_t port) :
   m_urlPrefix(urlPrefix),
   m_pushbackDepth(0),
   m_contentLength(0),
+  m_acceptGzip(false),
   m_failureCmd(&defaultFailCmd),
   m_defaultCmd(&defaultFailCmd),
   m_cmdCount(0),
+  m_routes(NULL),
+  m_routeCount(0),
   m_urlPathCmd(NULL),
   m_bufFill(0)
 {
@@ -364,6 +434,12 @@ void WebServer::addCommand(const char *verb, Command *cmd)
   }
 }
 
+void WebServer::setRoutes(const Route *routes, size_t count)
+{
+  m_routes = routes;
+  m_routeCount = count;
+}
+
 void WebServer::setUrlPathCommand(UrlPathCommand *cmd)
 {
   m_urlPathCmd = cmd;
@@ -399,11 +475,24 @@ void WebServer::flushBuf()
 
 void WebServer::writeP(const unsigned char *data, size_t length)
 {
-  // copy data out of program memory into local storage
+  // send buffered output first to keep the order of the data
+  flushBuf();
 
-  while (length--)
+  while (length > 0)
   {
-    write(pgm_read_byte(data++));
+#ifdef __AVR__
+    // copy data out of program memory into local storage
+    size_t chunk = (length < sizeof(m_buffer)) ? length : sizeof(m_buffer);
+    memcpy_P(m_buffer, data, chunk);
+    m_client.write(m_buffer, chunk);
+#else
+    // program memory is memory mapped, so it can be sent directly
+    size_t chunk = (length < WEBDUINO_WRITE_CHUNK_SIZE) ?
+      length : WEBDUINO_WRITE_CHUNK_SIZE;
+    m_client.write(data, chunk);
+#endif
+    data += chunk;
+    length -= chunk;
   }
 }
 
@@ -448,6 +537,31 @@ void WebServer::printf(const __FlashStringHelper *format, ... )
 }
 #endif
 
+const WebServer::Route *WebServer::findRoute(const char *verb,
+                                             size_t verb_len)
+{
+  // binary search over the sorted route table
+  size_t low = 0;
+  size_t high = m_routeCount;
+  while (low < high)
+  {
+    size_t mid = low + (high - low) / 2;
+    const char *route = m_routes[mid].verb;
+    int cmp = strncmp(verb, route, verb_len);
+    // verb is a prefix of the route, so it is sorted before it
+    if ((cmp == 0) && (route[verb_len] != 0))
+      cmp = -1;
+
+    if (cmp == 0)
+      return &m_routes[mid];
+    if (cmp < 0)
+      high = mid;
+    else
+      low = mid + 1;
+  }
+  return NULL;
+}
+
 bool WebServer::dispatchCommand(ConnectionType requestType, char *verb,
         bool tail_complete)
 {
@@ -482,6 +596,14 @@ bool WebServer::dispatchCommand(ConnectionType requestType, char *verb,
     qm_loc = strchr(verb, '?');
     verb_len = (qm_loc == NULL) ? strlen(verb) : (qm_loc - verb);
     qm_offset = (qm_loc == NULL) ? 0 : 1;
+    const Route *route = findRoute(verb, verb_len);
+    if (route != NULL)
+    {
+      route->cmd(*this, requestType,
+                 verb + verb_len + qm_offset,
+                 tail_complete);
+      return true;
+    }
     for (i = 0; i < m_cmdCount; ++i)
     {
       if ((verb_len == strlen(m_commands[i].verb))
@@ -692,8 +814,105 @@ void WebServer::httpNoContent()
   printP(noContentMsg2);
 }
 
-void WebServer::httpSuccess(const char *contentType,
-                            const char *extraHeaders)
+void WebServer::httpNotAcceptable()
+{
+  P(notAcceptableMsg1) = "HTTP/1.0 406 Not Acceptable" CRLF;
+  printP(notAcceptableMsg1);
+
+#ifndef WEBDUINO_SUPRESS_SERVER_HEADER
+  printP(webServerHeader);
+#endif
+
+  P(notAcceptableMsg2) = 
+    "Content-Type: text/html" CRLF
+    CRLF
+    WEBDUINO_NOT_ACCEPTABLE_MESSAGE;
+
+  printP(notAcceptableMsg2);
+}
+
+// returns true if the value of an Accept-Encoding header allows the
+// (lower case) coding. Codings with "q=0" are not allowed, "*" stands
+// for all codings not listed.
+static bool encodingAccepted(const char *header, const char *coding)
+{
+  int wildcard = 0; // 1: allowed by "*", -1: excluded by "*"
+  const char *entry = header;
+  while (*entry)
+  {
+    while (*entry == ' ' || *entry == '\t' || *entry == ',')
+      ++entry;
+
+    // coding name, compared case insensitive
+    const char *name = coding;
+    const char *end = entry;
+    bool matches = true;
+    while (*end && *end != ',' && *end != ';' && *end != ' ' && *end != '\t')
+    {
+      char c = *end++;
+      if (c >= 'A' && c <= 'Z')
+        c += 'a' - 'A';
+      if (*name == c)
+        ++name;
+      else
+        matches = false;
+    }
+    matches = matches && *name == 0;
+    bool any = (end - entry == 1 && *entry == '*');
+
+    // parameters, only q is of interest
+    bool allowed = true;
+    while (*end && *end != ',')
+    {
+      if ((end[0] == 'q' || end[0] == 'Q') && end[1] == '=' &&
+          (end[-1] == ';' || end[-1] == ' ' || end[-1] == '\t'))
+      {
+        // q=0, q=0.0, q=0.00 and q=0.000 exclude the coding
+        const char *value = end + 2;
+        allowed = (*value != '0');
+        if (*value == '0' && *++value == '.')
+        {
+          while (*++value >= '0' && *value <= '9')
+            if (*value != '0')
+              allowed = true;
+        }
+      }
+      ++end;
+    }
+
+    if (matches && end != entry)
+      return allowed;
+    if (any)
+      wildcard = allowed ? 1 : -1;
+    entry = end;
+  }
+  return wildcard == 1;
+}
+
+bool WebServer::checkETag(const char *etag)
+{
+  if (m_ifNoneMatch[0] == 0)
+    return false;
+  if (strcmp(m_ifNoneMatch, "*") == 0)
+    return true;
+  return strstr(m_ifNoneMatch, etag) != NULL;
+}
+
+void WebServer::httpNotModified(const char *extraHeaders)
+{
+  P(notModifiedMsg1) = "HTTP/1.0 304 Not Modified" CRLF;
+  printP(notModifiedMsg1);
+
+#ifndef WEBDUINO_SUPRESS_SERVER_HEADER
+  printP(webServerHeader);
+#endif
+
+  if (extraHeaders)
+    print(extraHeaders);
+  printCRLF();
+}
+
+void WebServer::printSuccessHeaders(const char *contentType)
 {
   P(successMsg1) = "HTTP/1.0 200 OK" CRLF;
   printP(successMsg1);
@@ -709,6 +928,28 @@ void WebServer::httpSuccess(const char *contentType,
   printP(successMsg2);
   print(contentType);
   printCRLF();
+}
+
+void WebServer::httpSuccess(const char *contentType,
+                            const char *extraHeaders)
+{
+  printSuccessHeaders(contentType);
+  if (extraHeaders)
+    print(extraHeaders);
+  printCRLF();
+}
+
+void WebServer::httpSuccess(const char *contentType,
+                            const char *extraHeaders,
+                            size_t contentLength)
+{
+  printSuccessHeaders(contentType);
+
+  P(contentLengthMsg) = "Content-Length: ";
+  printP(contentLengthMsg);
+  print((unsigned long)contentLength);
+  printCRLF();
+
   if (extraHeaders)
     print(extraHeaders);
   printCRLF();
@@ -1174,14 +1415,19 @@ void WebServer::getRequest(WebServer::ConnectionType &type,
 
 void WebServer::processHeaders()
 {
-  // look for three things: the Content-Length header, the Authorization
-  // header, and the double-CRLF that ends the headers.
+  // look for five things: the Content-Length header, the Authorization
+  // header, the Accept-Encoding header, the If-None-Match header and the
+  // double-CRLF that ends the headers.
 
   // empty the m_authCredentials before every run of this function.
   // otherwise users who don't send an Authorization header would be treated
   // like the last user who tried to authenticate (possibly successful)
   m_authCredentials[0]=0;
 
+  // without an Accept-Encoding header every coding is acceptable
+  m_acceptGzip = true;
+  m_ifNoneMatch[0] = 0;
+
   while (1)
   {
     if (expect("Content-Length:"))
@@ -1206,6 +1452,30 @@ void WebServer::processHeaders()
       continue;
     }
 
+    if (expect("Accept-Encoding:"))
+    {
+      char acceptEncoding[64];
+      readHeader(acceptEncoding, sizeof(acceptEncoding));
+      m_acceptGzip = encodingAccepted(acceptEncoding, "gzip");
+#if WEBDUINO_SERIAL_DEBUGGING > 1
+      Serial.print("\n*** got Accept-Encoding: of ");
+      Serial.print(acceptEncoding);
+      Serial.print(" ***");
+#endif
+      continue;
+    }
+
+    if (expect("If-None-Match:"))
+    {
+      readHeader(m_ifNoneMatch, sizeof(m_ifNoneMatch));
+#if WEBDUINO_SERIAL_DEBUGGING > 1
+      Serial.print("\n*** got If-None-Match: of ");
+      Serial.print(m_ifNoneMatch);
+      Serial.print(" ***");
+#endif
+      continue;
+    }
+
     if (expect(CRLF CRLF))
     {
       m_readingContent = true;
@@ -0,0 +1,25 @@
+{#- Definition and declaration of a static, binary or compressed page.
+    Used by commands.h and by asset.cpp for split builds. -#}
+
+{%- macro define_asset(data) %}
+{%- if data.file_type == 0 %}
+static const unsigned char f_{{data.file_hash}}_s[] PROGMEM = "{{data.file_content}}";
+static const char f_{{data.file_hash}}_e[] = "\"{{data.file_etag}}\"";
+static const char f_{{data.file_hash}}_h[] = "ETag: \"{{data.file_etag}}\"" CRLF "Cache-Control: " WEBDUINO_CACHE_CONTROL CRLF;
+{{"inline " if not splitAssets}}void f_{{data.file_hash}} (WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete) { staticResponder(server, type, url_tail, tail_complete, f_{{data.file_hash}}_s, sizeof(f_{{data.file_hash}}_s) - 1, m_{{data.mime_hash}}_s, f_{{data.file_hash}}_e, f_{{data.file_hash}}_h); }
+{%- elif data.file_type == 1 %}
+static const unsigned char f_{{data.file_hash}}_s[] PROGMEM = {{data.file_content}};
+static const char f_{{data.file_hash}}_e[] = "\"{{data.file_etag}}\"";
+static const char f_{{data.file_hash}}_h[] = "ETag: \"{{data.file_etag}}\"" CRLF "Cache-Control: " WEBDUINO_CACHE_CONTROL CRLF;
+{{"inline " if not splitAssets}}void f_{{data.file_hash}} (WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete) { staticResponder(server, type, url_tail, tail_complete, f_{{data.file_hash}}_s, sizeof(f_{{data.file_hash}}_s), m_{{data.mime_hash}}_s, f_{{data.file_hash}}_e, f_{{data.file_hash}}_h); }
+{%- elif data.file_type == 3 %}
+static const unsigned char f_{{data.file_hash}}_s[] PROGMEM = {{data.file_content}};
+static const char f_{{data.file_hash}}_e[] = "\"{{data.file_etag}}\"";
+static const char f_{{data.file_hash}}_h[] = "ETag: \"{{data.file_etag}}\"" CRLF "Cache-Control: " WEBDUINO_CACHE_CONTROL CRLF "Content-Encoding: gzip" CRLF "Vary: Accept-Encoding" CRLF;
+{{"inline " if not splitAssets}}void f_{{data.file_hash}} (WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete) { compressedResponder(server, type, url_tail, tail_complete, f_{{data.file_hash}}_s, sizeof(f_{{data.file_hash}}_s), m_{{data.mime_hash}}_s, f_{{data.file_hash}}_e, f_{{data.file_hash}}_h); }
+{%- endif %}
+{%- endmacro %}
+
+{%- macro declare_asset(data) %}
+void f_{{data.file_hash}} (WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete);
+{%- endmacro %}
@@ -0,0 +1,6 @@
+// {{file}}
+// Compiled on its own in split builds, so only changed files are compiled again.
+#define WEBDUINO_NO_IMPLEMENTATION
+#include "assets.h"
+{%- from "_asset.h" import define_asset with context %}
+{{ define_asset(data) }}
@@ -0,0 +1,59 @@
+#pragma once
+
+// Shared by commands.h and the asset files of split builds
+#include "WebServer.h"
+
+// Responde with "304 Not Modified" if the client has the current version.
+// Returns true if the response was sent.
+inline bool notModifiedResponder(WebServer &server, const char* etag, const char* headers)
+{
+  if (!server.checkETag(etag))
+    return false;
+
+  server.httpNotModified(headers);
+  return true;
+}
+
+// Responde with data from PROGMEM
+inline void staticResponder(WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete, const unsigned char* response, size_t response_size, const char* mime, const char* etag, const char* headers)
+{
+  if (notModifiedResponder(server, etag, headers))
+    return;
+
+  server.httpSuccess(mime, headers, response_size);
+
+  /* if we're handling a GET or POST, we can output our data here.
+     For a HEAD request, we just stop after outputting headers. */
+  if (type != WebServer::ConnectionType::HEAD)
+  {
+    /* this is a special form of print that outputs from PROGMEM */
+    server.writeP(response, response_size);
+  }
+}
+
+// Responde with gzip compressed data from PROGMEM
+inline void compressedResponder(WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete, const unsigned char* response, size_t response_size, const char* mime, const char* etag, const char* headers)
+{
+  // Data is only stored compressed. Clients that sent no Accept-Encoding
+  // header accept gzip. Clients that excluded it can not be served.
+  if (!server.acceptsGzip())
+  {
+    server.httpNotAcceptable();
+    return;
+  }
+
+  if (notModifiedResponder(server, etag, headers))
+    return;
+
+  server.httpSuccess(mime, headers, response_size);
+
+  if (type != WebServer::ConnectionType::HEAD)
+  {
+    server.writeP(response, response_size);
+  }
+}
+
+// MIME TYPES
+{%- for mime, hash in mimeData.items() %}
+static const char m_{{hash}}_s[] = "{{mime}}";
+{%- endfor %}
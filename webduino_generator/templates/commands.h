@@ -1,51 +1,22 @@
 #pragma once
 
-// Responde with string from PROGMEM. Read till \0
-inline void staticResponder(WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete, const unsigned char* response, const char* mime)
-{
-  server.httpSuccess(mime);
-
-  if (type != WebServer::ConnectionType::HEAD)
-  {
-    server.printP(response);
-  }
-}
-
-// Responde with data from PROGMEM
-inline void staticResponder(WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete, const unsigned char* response, size_t response_size, const char* mime)
-{
-  server.httpSuccess(mime);
-
-  /* if we're handling a GET or POST, we can output our data here.
-     For a HEAD request, we just stop after outputting headers. */
-  if (type != WebServer::ConnectionType::HEAD)
-  {
-    /* this is a special form of print that outputs from PROGMEM */
-    server.writeP(response, response_size);
-  }
-}
-
-// MIME TYPES
-{%- for mime, hash in mimeData.items() %}
-static const char m_{{hash}}_s[] = "{{mime}}";
-{%- endfor %}
-
-// STATIC PAGES
-{%- for file, data in fileData.items() %}
-{%- if data.file_type == 0 %}
-static const unsigned char f_{{data.file_hash}}_s[] PROGMEM = "{{data.file_content}}";
-inline void f_{{data.file_hash}} (WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete) { staticResponder(server, type, url_tail, tail_complete, f_{{data.file_hash}}_s, m_{{data.mime_hash}}_s); }
+// Changes whenever any of the served files changes
+#define WGEN_BUILD_ID "{{metaData.build_id}}"
+
+// Responders and MIME types
+#include "assets.h"
+{%- from "_asset.h" import define_asset, declare_asset with context %}
+{% for title, file_type in [("STATIC", 0), ("BINARY", 1), ("COMPRESSED", 3)] %}
+// {{title}} PAGES
+{%- if splitAssets %}
+// Defined in asset_*.cpp
 {%- endif %}
-{%- endfor %}
-
-// BINARY PAGES
 {%- for file, data in fileData.items() %}
-{%- if data.file_type == 1 %}
-static const unsigned char f_{{data.file_hash}}_s[] PROGMEM = {{data.file_content}};
-inline void f_{{data.file_hash}} (WebServer &server, WebServer::ConnectionType type, char *url_tail, bool tail_complete) { staticResponder(server, type, url_tail, tail_complete, f_{{data.file_hash}}_s, sizeof(f_{{data.file_hash}}_s), m_{{data.mime_hash}}_s); }
+{%- if data.file_type == file_type %}
+{{- declare_asset(data) if splitAssets else define_asset(data) }}
 {%- endif %}
 {%- endfor %}
-
+{% endfor %}
 // DYNAMIC PAGES
 {%- for file, data in fileData.items() %}
 {%- if data.file_type == 2 %}
@@ -55,3 +26,13 @@ namespace f_{{data.file_hash}}
 }
 {% endif %}
 {%- endfor %}
+
+// ROUTES
+// Sorted by file name, as fileData is, for binary search in WebServer
+{%- if fileData %}
+static const WebServer::Route routes[] = {
+{%- for file, data in fileData.items() %}
+  { "{{file}}", &f_{{data.file_hash}}{{"::respond" if data.file_type == 2}} },
+{%- endfor %}
+};
+{%- endif %}
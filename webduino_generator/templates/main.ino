@@ -23,14 +23,15 @@ void setup()
     }
     else
         Serial.println(WiFi.localIP());
+    Serial.println("Build " WGEN_BUILD_ID);
 
     {% if 'index.html' in fileData %}
     webserver.setDefaultCommand(&f_{{fileData['index.html'].file_hash}});
     {%- endif %}
 
-    {% for file, data in fileData.items() %}
-    webserver.addCommand("{{file}}", &f_{{data.file_hash}}{{"::respond" if data.file_type == 2}});
-    {%- endfor %}
+    {% if fileData %}
+    webserver.setRoutes(routes, SIZE(routes));
+    {%- endif %}
 
     webserver.begin();
 }
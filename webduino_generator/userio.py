@@ -1,4 +1,5 @@
 import getpass
+import os
 from typing import Tuple, List
 
 from rich.console import Console
@@ -6,10 +7,37 @@ from rich.table import Table
 from rich import box
 
 
+def get_env_password(userio):
+    # Returns password from WGEN_PASSWORD or from the file named by
+    # WGEN_PASSWORD_FILE. None if neither is set.
+    if "WGEN_PASSWORD" in os.environ:
+        return os.environ["WGEN_PASSWORD"]
+
+    path = os.environ.get("WGEN_PASSWORD_FILE")
+    if not path:
+        return None
+    try:
+        with open(path, "r") as file:
+            return file.read().rstrip("\r\n")
+    except OSError:
+        userio.error("Could not read password file " + path)
+
+
 def get_ssid_pass(userio, ssid, no_warn):
-    # Get SSID and password for wifi connection
+    # Get SSID and password for wifi connection. Credentials in the
+    # environment (WGEN_SSID, WGEN_PASSWORD or WGEN_PASSWORD_FILE) are
+    # used instead of asking the user.
     if not no_warn:
         userio.warn("SSID and Password will be saved as plaintext in the output!")
+    if ssid == "":
+        ssid = os.environ.get("WGEN_SSID", "")
+
+    password = get_env_password(userio)
+    if password is not None:
+        if ssid == "":
+            ssid = userio.get_user("Please enter network credentials:", "SSID: ")
+        return ssid, password
+
     if ssid == "":
         ssid = userio.get_user("Please enter network credentials:", "SSID: ")
         return ssid, userio.get_pass(None, "Password: ")
@@ -17,11 +45,32 @@ def get_ssid_pass(userio, ssid, no_warn):
         return ssid, userio.get_pass("Please enter network credentials:\nSSID: " + ssid, "Password: ")
 
 
+class _NoProgress():
+    # Stand-in for rich.progress.Progress that renders nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def add_task(self, description, **kwargs):
+        return 0
+
+    def update(self, task, **kwargs):
+        pass
+
+
 class UserIO:
     console = Console()
     console._log_render.show_time = False
     verbose = False
 
+    # Never wait for the user and render no progress bars (e.g. on CI)
+    interactive = True
+
+    # Confirm deletions without asking (--yes)
+    assume_yes = False
+
     def __out__(self, *args):
         if self.verbose:
             self.console.log(*args)
@@ -32,8 +81,12 @@ class UserIO:
         self.__out__("\n[bold blue]::", "[bold white]" + text)
 
     def print(self, text: str, verbose: bool = False) -> None:
+        # text can be a function returning the text. It is only called
+        # if the text is shown.
         if verbose and not self.verbose:
             return
+        if callable(text):
+            text = text()
         self.__out__(text)
 
     def warn(self, text: str) -> None:
@@ -45,8 +98,12 @@ class UserIO:
 
     def quick_table(self, title: str, header: List[str], rows: List[List[str]],
                     verbose: bool = False) -> None:
+        # rows can be a function returning the rows. It is only called
+        # if the table is shown.
         if verbose and not self.verbose:
             return
+        if callable(rows):
+            rows = rows()
 
         table = Table(title=title)
         table.box = box.SIMPLE_HEAD
@@ -58,7 +115,60 @@ class UserIO:
 
         self.__out__(table)
 
+    def progress(self):
+        '''Returns progress bar. Renders nothing if not interactive.'''
+
+        if not self.interactive:
+            return _NoProgress()
+
+        from rich.progress import Progress, BarColumn
+        return Progress(BarColumn(),
+                        "[progress.percentage]{task.percentage:>3.1f}%",
+                        "[progress.description]{task.description}")
+
+    def confirm(self, text: str, action: str = None) -> bool:
+        '''Waits for the user to press Enter. Returns False if canceled.
+           action describes what is about to be deleted. If not
+           interactive, deletions are only confirmed with --yes (and
+           fail otherwise). Other confirmations pass right away.'''
+
+        if self.assume_yes:
+            self.print("Confirmed (--yes)" + (": " + action if action else ""))
+            return True
+
+        if not self.interactive:
+            if action is not None:
+                self.error("Not confirmed in non-interactive mode: %s. "
+                           "Pass --yes to confirm." % action)
+            self.print("Confirmed (non-interactive mode)")
+            return True
+
+        self.print(text)
+        try:
+            input()
+            return True
+        except KeyboardInterrupt:
+            return False
+
+    def select(self, prompt: str, options: List[str]) -> int:
+        '''Lets the user select an option from a menu. Returns its index
+           or None if canceled.'''
+
+        # A single option is selected without asking if not interactive
+        if not self.interactive:
+            if len(options) == 1:
+                self.print(prompt + " " + options[0])
+                return 0
+            self.error("%s (not possible in non-interactive mode)" % prompt.rstrip(":"))
+
+        from simple_term_menu import TerminalMenu
+        self.print(prompt)
+        terminal_menu = TerminalMenu(options, menu_highlight_style=None)
+        return terminal_menu.show()
+
     def get_user(self, prompt: str, userText: str) -> Tuple[str, str]:
+        if not self.interactive:
+            self.error(userText.rstrip(": ") + " required in non-interactive mode.")
         if prompt is not None:
             self.console.print(prompt)
         self.console.print(userText, end="")
@@ -69,6 +179,9 @@ class UserIO:
         return userValue
 
     def get_pass(self, prompt: str, passText: str) -> Tuple[str, str]:
+        if not self.interactive:
+            self.error(passText.rstrip(": ") + " required in non-interactive mode. "
+                       "Set WGEN_PASSWORD or WGEN_PASSWORD_FILE.")
         if prompt is not None:
             self.console.print(prompt)
         try:
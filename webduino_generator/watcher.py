@@ -0,0 +1,176 @@
+import ctypes
+import ctypes.util
+import select
+import struct
+import time
+import os
+
+
+class PollingWatcher():
+    """Detects changes in folders by comparing modification times and
+       sizes of all files. Works on every platform."""
+
+    name = "polling"
+
+    def __init__(self, folders, interval=0.5):
+        self.folders = folders
+        self.interval = interval
+        self.snapshot = self.scan()
+
+    def scan(self):
+        files = {}
+        for folder in self.folders:
+            for dir_, _, files_ in os.walk(folder):
+                for file_name in files_:
+                    path = os.path.join(dir_, file_name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def poll(self, timeout):
+        '''Returns set of paths changed since the last call. Waits up to
+           timeout seconds (None: forever) for a change.'''
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.scan()
+            changes = {path for path in snapshot.keys() | self.snapshot.keys()
+                       if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changes:
+                return changes
+
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return set()
+                time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher():
+    """Detects changes in folders using the Linux inotify API. New sub
+       folders are watched as soon as they are created."""
+
+    name = "inotify"
+
+    # Flags from <sys/inotify.h>
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+        IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    _event = struct.Struct("iIII")
+
+    def __init__(self, folders):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.folders = {}
+        try:
+            for folder in folders:
+                self.add_tree(folder)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, folder):
+        for dir_, _, _ in os.walk(folder):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_),
+                                             self.MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(),
+                              "Could not watch " + dir_)
+            self.folders[wd] = dir_
+
+    def read(self):
+        # Returns paths of all pending events
+        changes = set()
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changes
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = self._event.unpack_from(buffer, offset)
+                offset += self._event.size
+                name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    # Events were lost. Report the folders themselves.
+                    changes.update(self.folders.values())
+                    continue
+
+                folder = self.folders.get(wd)
+                if folder is None:
+                    continue
+                path = os.path.join(folder, name) if name else folder
+                changes.add(path)
+
+                if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    try:
+                        self.add_tree(path)
+                    except OSError:
+                        # Folder was removed again in the meantime
+                        pass
+
+    def poll(self, timeout):
+        '''Returns set of paths changed since the last call. Waits up to
+           timeout seconds (None: forever) for a change.'''
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        return self.read()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(folders, polling=False, interval=0.5):
+    '''Returns watcher for folders. Uses inotify where available and
+       falls back to polling otherwise.'''
+
+    if not polling and hasattr(os, "O_CLOEXEC"):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError, TypeError):
+            pass
+    return PollingWatcher(folders, interval)
+
+
+def wait_for_changes(watcher, debounce):
+    '''Blocks until files changed and no further change happened for
+       debounce seconds. Returns changed paths and the time the first
+       change was detected (time.perf_counter).'''
+
+    changes = watcher.poll(None)
+    first_change = time.perf_counter()
+
+    while True:
+        more = watcher.poll(debounce)
+        if not more:
+            return changes, first_change
+        changes |= more